@@ -39,15 +39,297 @@ short_description: HttpApi Plugin for Fortinet FortiOS Appliance or VM
 description:
   - This HttpApi plugin provides methods to connect to Fortinet FortiOS Appliance or VM via REST API
 version_added: "2.9"
+options:
+  keepalive:
+    type: boolean
+    default: True
+    description:
+      - Reuse one HTTP(S) connection to the device across requests instead of opening a new one for each request.
+      - The kept alive connection is not used when use_proxy is set and the environment defines a proxy for the device,
+        the requests then go through the connection plugin as without keepalive.
+      - The kept alive connection validates certificates against the default CA store of the system when validate_certs
+        is set. It is not used either when the connection sets ca_path, client_cert, client_key or ciphers,
+        the requests then go through the connection plugin which applies them.
+    vars:
+      - name: ansible_httpapi_fortios_keepalive
+  keepalive_idle_timeout:
+    type: int
+    default: 20
+    description:
+      - Seconds a kept alive connection may stay idle before it is reopened.
+    vars:
+      - name: ansible_httpapi_fortios_keepalive_idle_timeout
+  keepalive_max_requests:
+    type: int
+    default: 100
+    description:
+      - Number of requests sent over one kept alive connection before it is reopened.
+    vars:
+      - name: ansible_httpapi_fortios_keepalive_max_requests
+  mkey_cache:
+    type: boolean
+    default: False
+    description:
+      - Remember which objects exist in each table for the lifetime of the connection, so that modules
+        send a PUT for existing objects and a POST for new ones instead of trying PUT first.
+      - A table is read once with its mkeys only, the index is then kept up to date with the responses
+        of later requests and dropped when a write fails.
+      - Only enable it if the tables are not changed by others while the playbook runs.
+    vars:
+      - name: ansible_httpapi_fortios_mkey_cache
+  check_mode_cache:
+    type: boolean
+    default: False
+    description:
+      - Remember the objects looked up in check mode per path, name, vdom and mkey for check_mode_cache_ttl seconds,
+        so that checking an object again does not send another GET.
+      - All the cached objects are dropped when any request other than a GET is sent through the connection.
+    vars:
+      - name: ansible_httpapi_fortios_check_mode_cache
+  check_mode_prefetch:
+    type: boolean
+    default: False
+    description:
+      - In check mode, read the table of an object whole the first time one of its objects is looked up,
+        and answer the later lookups of the same table and vdom from memory for check_mode_cache_ttl seconds.
+      - A play checking many objects of one table then sends one GET instead of one GET per object.
+      - The prefetched tables are dropped when any request other than a GET is sent through the connection.
+    vars:
+      - name: ansible_httpapi_fortios_check_mode_prefetch
+  check_mode_cache_ttl:
+    type: int
+    default: 60
+    description:
+      - Seconds a cached object or a prefetched table answers lookups, it is read again from the device after that.
+      - This bounds how much older than the device configuration a check mode result may be.
+    vars:
+      - name: ansible_httpapi_fortios_check_mode_cache_ttl
+  log_file:
+    type: path
+    default: /tmp/fortios.ansible.log
+    description:
+      - File the plugin log is written to when enable_log is set, one JSON record per line.
+    vars:
+      - name: ansible_httpapi_fortios_log_file
+  log_max_bytes:
+    type: int
+    default: 10485760
+    description:
+      - Size in bytes at which the log file is rotated, 0 to never rotate.
+    vars:
+      - name: ansible_httpapi_fortios_log_max_bytes
+  log_backup_count:
+    type: int
+    default: 3
+    description:
+      - Number of rotated log files kept.
+    vars:
+      - name: ansible_httpapi_fortios_log_backup_count
+  log_max_body:
+    type: int
+    default: -1
+    description:
+      - Number of characters of request and response bodies kept in the log, -1 to keep them whole.
+    vars:
+      - name: ansible_httpapi_fortios_log_max_body
+  log_body_sample_rate:
+    type: float
+    default: 1.0
+    description:
+      - Fraction of the requests whose bodies are logged, the other requests are logged without bodies.
+    vars:
+      - name: ansible_httpapi_fortios_log_body_sample_rate
+  system_version_cache_file:
+    type: path
+    description:
+      - File in which the firmware version of each device is kept across connections and tasks,
+        the firmware version is not cached across connections if not given.
+      - The versions are keyed by host and port only, the firmware of a device does not depend on the
+        credentials or the vdom used to reach it.
+    vars:
+      - name: ansible_httpapi_fortios_system_version_cache_file
+  system_version_cache_ttl:
+    type: int
+    default: 600
+    description:
+      - Seconds a firmware version cached in system_version_cache_file stays valid, 0 to always query the device.
+    vars:
+      - name: ansible_httpapi_fortios_system_version_cache_ttl
 """
 
+import atexit
 import json
+import os
+import random
+import ssl
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from ansible.plugins.httpapi import HttpApiBase
 from ansible.module_utils.basic import to_text
+from ansible.module_utils.basic import to_bytes
 from ansible.module_utils.six.moves import urllib
+from ansible.module_utils.six.moves import http_client
+from ansible.module_utils.six.moves import queue
 import re
 from datetime import datetime
 
+SYSTEM_STATUS_URL = '/api/v2/monitor/system/status'
+
+# TLS options of the httpapi connection which only connection.send applies
+KEEPALIVE_UNSUPPORTED_OPTIONS = ['ca_path', 'client_cert', 'client_key', 'ciphers']
+
+try:
+    # the device closed an idle kept alive connection before reading the request
+    STALE_CONNECTION_ERRORS = (http_client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+except (AttributeError, NameError):
+    STALE_CONNECTION_ERRORS = (http_client.BadStatusLine,)
+
+
+class LogWriter(object):
+    """
+    Write the log records from a background thread, so that logging does not wait
+    for the disk, and rotate the log file once it reaches max_bytes.
+    """
+
+    def __init__(self, path, max_bytes, backup_count):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._file = None
+        self._size = 0
+        self._records = queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        self._records.put(record)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._records.put(None)
+            self._thread.join(5)
+
+    def _open(self):
+        self._file = open(self._path, 'a')
+        self._file.seek(0, os.SEEK_END)
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self._backup_count - 1, 0, -1):
+            if os.path.exists('%s.%d' % (self._path, index)):
+                os.rename('%s.%d' % (self._path, index), '%s.%d' % (self._path, index + 1))
+        if self._backup_count > 0:
+            os.rename(self._path, '%s.1' % (self._path))
+        else:
+            os.remove(self._path)
+        self._open()
+
+    def _run(self):
+        self._open()
+        closed = False
+        while not closed:
+            records = [self._records.get()]
+            while not self._records.empty() and records[-1] is not None:
+                records.append(self._records.get())
+            for record in records:
+                if record is None:
+                    closed = True
+                    break
+                if self._max_bytes > 0 and self._size and self._size + len(record) > self._max_bytes:
+                    self._rotate()
+                self._file.write(record)
+                self._size += len(record)
+            # one flush per batch of records instead of one per record
+            self._file.flush()
+        self._file.close()
+
+
+class KeepAliveConnection(object):
+    """
+    A single HTTP(S) connection to the device which is reused across requests,
+    it is reopened once it has been idle or served too many requests.
+    """
+
+    def __init__(self, host, port, use_ssl, validate_certs, timeout, idle_timeout, max_requests):
+        self._host = host
+        self._port = port
+        self._use_ssl = use_ssl
+        self._validate_certs = validate_certs
+        self._timeout = timeout
+        self._idle_timeout = idle_timeout
+        self._max_requests = max_requests
+        self._connection = None
+        self._last_used = 0
+        self._served_requests = 0
+        self.opened = 0
+        self.reused = 0
+
+    def _open(self):
+        self.close()
+        if self._use_ssl:
+            context = ssl.create_default_context()
+            if not self._validate_certs:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self._connection = http_client.HTTPSConnection(self._host, self._port, timeout=self._timeout, context=context)
+        else:
+            self._connection = http_client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+        self._served_requests = 0
+        self.opened += 1
+
+    def _acquire(self):
+        expired = time.time() - self._last_used > self._idle_timeout
+        exhausted = self._served_requests >= self._max_requests
+        if self._connection is None or expired or exhausted:
+            self._open()
+            return False
+        self.reused += 1
+        return True
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def request(self, method, url, data, headers):
+        """
+        Send one request and read the whole response.
+        :return: the response and its body.
+        """
+        reused = self._acquire()
+        sent = False
+        try:
+            self._connection.request(method, url, body=to_bytes(data) if data else None, headers=headers)
+            sent = True
+            response = self._connection.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            self.close()
+            # once a write went out the device may have applied it even if it did not answer, never resend it.
+            if not reused or sent and method != 'GET':
+                raise
+            # the device closed the idle connection, the request is sent again once.
+            self._open()
+            try:
+                self._connection.request(method, url, body=to_bytes(data) if data else None, headers=headers)
+                response = self._connection.getresponse()
+            except Exception:
+                self.close()
+                raise
+        except Exception:
+            # a timeout or an error after the request was sent, it may have been applied: never resend it.
+            self.close()
+            raise
+        response_data = response.read()
+        self._served_requests += 1
+        self._last_used = time.time()
+        if response.will_close:
+            self.close()
+        return response, response_data
+
 
 class HttpApi(HttpApiBase):
     def __init__(self, connection):
@@ -59,17 +341,52 @@ class HttpApi(HttpApiBase):
         self._ansible_fos_version = '{{__fortios_version__}}'
         self._ansible_galaxy_version = '{{__galaxy_version__}}'
         self._log = None
+        self._log_lock = threading.Lock()
+        self._keepalive = None
+        self._keepalive_workers = list()
+        self._mkey_index = dict()
+        self._lookup_cache = dict()
+
+    def _write_log(self, record):
+        if not self._log:
+            # send_requests logs from the threads of its pool, only one of them may start the writer
+            with self._log_lock:
+                if not self._log:
+                    self._log = LogWriter(self._get_plugin_option('log_file', '/tmp/fortios.ansible.log'),
+                                          self._get_plugin_option('log_max_bytes', 10485760),
+                                          self._get_plugin_option('log_backup_count', 3))
+        record['time'] = str(datetime.now())
+        self._log.write(json.dumps(record, sort_keys=True) + '\n')
 
     def log(self, msg):
         log_enabled = self._conn.get_option('enable_log')
         if not log_enabled:
             return
-        if not self._log:
-            self._log = open("/tmp/fortios.ansible.log", "a")
-        log_message = str(datetime.now())
-        log_message += ": " + str(msg) + '\n'
-        self._log.write(log_message)
-        self._log.flush()
+        self._write_log({'message': str(msg)})
+
+    def _log_body(self, body):
+        max_body = self._get_plugin_option('log_max_body', -1)
+        body = to_text(body) if body else ''
+        if max_body >= 0 and len(body) > max_body:
+            return body[:max_body] + '...(%d characters)' % (len(body))
+        return body
+
+    def log_request(self, method, url, data, status, response_data, started):
+        log_enabled = self._conn.get_option('enable_log')
+        if not log_enabled:
+            return
+        record = {
+            'method': method,
+            'url': url,
+            'status': status,
+            'latency_ms': round((time.time() - started) * 1000, 3),
+            'request_bytes': len(data) if data else 0,
+            'response_bytes': len(response_data) if response_data else 0,
+        }
+        if random.random() < self._get_plugin_option('log_body_sample_rate', 1.0):
+            record['request_data'] = self._log_body(data)
+            record['response_data'] = self._log_body(response_data)
+        self._write_log(record)
 
     def get_access_token(self):
         '''this is only available after a module is initialized'''
@@ -101,10 +418,11 @@ class HttpApi(HttpApiBase):
         else:
             self.log('login with access token')
             self.send_request(url='/logincheck')
-            status, dummy = self.send_request(url='/api/v2/cmdb/system/interface?vdom=root&action=schema')
+            status, result = self.send_request(url=SYSTEM_STATUS_URL)
 
             if status == 401:
                 raise Exception('Invalid access token. Please check')
+            self._learn_system_version(result)
 
         self.update_system_version()
 
@@ -112,6 +430,14 @@ class HttpApi(HttpApiBase):
         """ Call to implement session logout."""
         self.log('logout')
         self.send_request(url='/logout', method="POST")
+        if self._keepalive:
+            keepalives = [self._keepalive] + self._keepalive_workers
+            self.log('keepalive connections opened: %d, reused: %d' % (sum(keepalive.opened for keepalive in keepalives),
+                                                                       sum(keepalive.reused for keepalive in keepalives)))
+            for keepalive in keepalives:
+                keepalive.close()
+            self._keepalive = None
+            self._keepalive_workers = list()
 
     def update_auth(self, response, response_text):
         """
@@ -170,6 +496,109 @@ class HttpApi(HttpApiBase):
                 url += '&%s=%s' % (param_key, param_value)
         return url
 
+    def _get_plugin_option(self, name, default):
+        try:
+            value = self.get_option(name)
+        except Exception:
+            value = None
+        return default if value is None else value
+
+    def _new_keepalive_connection(self):
+        use_ssl = self._conn.get_option('use_ssl')
+        port = self._conn.get_option('port') or (443 if use_ssl else 80)
+        return KeepAliveConnection(self._conn.get_option('host'), port, use_ssl,
+                                   self._conn.get_option('validate_certs'),
+                                   self._conn.get_option('persistent_command_timeout'),
+                                   self._get_plugin_option('keepalive_idle_timeout', 20),
+                                   self._get_plugin_option('keepalive_max_requests', 100))
+
+    def _get_connection_option(self, name):
+        # the options of the httpapi connection differ between ansible versions
+        try:
+            return self._conn.get_option(name)
+        except KeyError:
+            return None
+
+    def _uses_unsupported_tls_options(self):
+        return any(self._get_connection_option(name) for name in KEEPALIVE_UNSUPPORTED_OPTIONS)
+
+    def _uses_proxy(self):
+        if not self._conn.get_option('use_proxy'):
+            return False
+        host = self._conn.get_option('host')
+        proxies = urllib.request.getproxies()
+        return bool(proxies.get('https' if self._conn.get_option('use_ssl') else 'http')) and not urllib.request.proxy_bypass(host)
+
+    def _get_keepalive_connection(self):
+        if not self._get_plugin_option('keepalive', True):
+            return None
+        if not self._keepalive:
+            if self._uses_proxy() or self._uses_unsupported_tls_options():
+                return None
+            self._keepalive = self._new_keepalive_connection()
+        if not self._conn._connected:
+            # the connection plugin logs in when it connects, which connection.send triggers otherwise
+            self._conn._connect()
+        return self._keepalive
+
+    def _send_keepalive(self, keepalive, url, data, method, update_auth=True):
+        headers = dict(self._conn._auth or {})
+        if data and 'Content-Type' not in headers:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        opened = keepalive.opened
+        response, response_data = keepalive.request(method, url, data, headers)
+        if keepalive.opened != opened:
+            self.log('keepalive connections opened: %d, reused: %d' % (keepalive.opened, keepalive.reused))
+        if update_auth:
+            self._conn._auth = self.update_auth(response, response_data) or self._conn._auth
+        return response.status, to_text(response_data)
+
+    def _request_url(self, url, params):
+        if self.get_access_token() is not None:
+            url = self._concat_token(url)
+        return self._concat_params(url, params)
+
+    def send_requests(self, requests, max_workers=4):
+        """
+        Send several GET requests at once, over at most max_workers kept alive connections.
+        :param requests: A list of dictionaries with url and params of each request.
+
+        :return: A list of [status code, response data, latency in seconds] in the order of the requests.
+        """
+        keepalive = self._get_keepalive_connection()
+        workers = min(max_workers, len(requests))
+        if not keepalive or workers <= 1:
+            responses = list()
+            for request in requests:
+                started = time.time()
+                status, json_formatted = self.send_request(url=request['url'], params=request.get('params'))
+                responses.append([status, json_formatted, time.time() - started])
+            return responses
+
+        while len(self._keepalive_workers) < workers - 1:
+            self._keepalive_workers.append(self._new_keepalive_connection())
+        idle_connections = queue.Queue()
+        for connection in [keepalive] + self._keepalive_workers[:workers - 1]:
+            idle_connections.put(connection)
+
+        def send(request):
+            url = self._request_url(request['url'], request.get('params'))
+            connection = idle_connections.get()
+            started = time.time()
+            try:
+                # GET requests don't renew the session, the auth headers are shared read-only
+                status, json_formatted = self._send_keepalive(connection, url, '', 'GET', update_auth=False)
+            finally:
+                idle_connections.put(connection)
+            self.log_request('GET', url, '', status, json_formatted, started)
+            return [status, json_formatted, time.time() - started]
+
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(send, requests)
+        finally:
+            pool.close()
+
     def send_request(self, **message_kwargs):
         """
         Responsible for actual sending of data to the connection httpapi base plugin.
@@ -178,25 +607,168 @@ class HttpApi(HttpApiBase):
         :return: Status code and response data.
         """
 
-        url = message_kwargs.get('url', '/')
-        if self.get_access_token() is not None:
-            url = self._concat_token(message_kwargs.get('url', '/'))
         data = message_kwargs.get('data', '')
         method = message_kwargs.get('method', 'GET')
-        params = message_kwargs.get('params', {})
 
-        url = self._concat_params(url, params)
-        self.log('send request: METHOD:%s URL:%s DATA:%s' % (method, url, data))
+        url = self._request_url(message_kwargs.get('url', '/'), message_kwargs.get('params', {}))
+        if method != 'GET' and self._lookup_cache:
+            # any write, including monitor and raw API calls, may change objects the cache holds
+            self._lookup_cache.clear()
+            self.log('cached lookups invalidated by %s %s' % (method, message_kwargs.get('url', '/')))
+        started = time.time()
         try:
+            keepalive = self._get_keepalive_connection()
+            if keepalive:
+                status, json_formatted = self._send_keepalive(keepalive, url, data, method)
+                self.log_request(method, url, data, status, json_formatted, started)
+                return status, json_formatted
+
             response, response_data = self.connection.send(url, data, method=method)
 
             json_formatted = to_text(response_data.getvalue())
 
-            self.log("response data: %s" % (json_formatted))
+            self.log_request(method, url, data, response.status, json_formatted, started)
             return response.status, json_formatted
         except Exception as err:
+            self.log_request(method, url, data, None, to_text(err), started)
             raise Exception(err)
 
+    def mkey_cache_enabled(self):
+        return self._get_plugin_option('mkey_cache', False)
+
+    def _get_mkey_table(self, path, name, vdom):
+        table_key = '%s/%s?vdom=%s' % (path, name, vdom)
+        if table_key not in self._mkey_index:
+            self._mkey_index[table_key] = {'complete': False, 'present': set(), 'absent': set()}
+        return self._mkey_index[table_key]
+
+    def lookup_mkey(self, path, name, vdom, mkey):
+        """
+        Look up whether an object exists in a table.
+        :return: True or False if known, None if the table has not been indexed.
+        """
+        table = self._get_mkey_table(path, name, vdom)
+        mkey = str(mkey)
+        if mkey in table['present']:
+            return True
+        if mkey in table['absent'] or table['complete']:
+            return False
+        return None
+
+    def set_mkey_index(self, path, name, vdom, mkeys):
+        table = self._get_mkey_table(path, name, vdom)
+        table['complete'] = True
+        table['present'] = set(str(mkey) for mkey in mkeys)
+        table['absent'] = set()
+        self.log('mkey index of %s/%s (vdom: %s): %d objects' % (path, name, vdom, len(table['present'])))
+
+    def learn_mkey(self, path, name, vdom, mkey, existed):
+        table = self._get_mkey_table(path, name, vdom)
+        mkey = str(mkey)
+        if existed:
+            table['present'].add(mkey)
+            table['absent'].discard(mkey)
+        else:
+            table['absent'].add(mkey)
+            table['present'].discard(mkey)
+
+    def invalidate_mkey_index(self, path, name, vdom):
+        self._mkey_index.pop('%s/%s?vdom=%s' % (path, name, vdom), None)
+        self.log('mkey index of %s/%s (vdom: %s) invalidated' % (path, name, vdom))
+
+    def check_mode_cache_enabled(self):
+        return self._get_plugin_option('check_mode_cache', False) or self.check_mode_prefetch_enabled()
+
+    def check_mode_prefetch_enabled(self):
+        return self._get_plugin_option('check_mode_prefetch', False)
+
+    def _get_lookup_table(self, path, name, vdom):
+        table_key = '%s/%s?vdom=%s' % (path, name, vdom)
+        if table_key not in self._lookup_cache:
+            self._lookup_cache[table_key] = {'prefetched': None, 'objects': dict()}
+        return self._lookup_cache[table_key]
+
+    def lookup_cached(self, path, name, vdom, mkey):
+        """
+        Look up an object in the lookup cache, entries older than check_mode_cache_ttl are ignored.
+        :return: a list with the object, empty if the object is known not to exist, None if unknown.
+        """
+        ttl = self._get_plugin_option('check_mode_cache_ttl', 60)
+        table = self._get_lookup_table(path, name, vdom)
+        entry = table['objects'].get(str(mkey))
+        if entry is not None and time.time() - entry['time'] <= ttl:
+            return entry['results']
+        if table['prefetched'] is not None:
+            if time.time() - table['prefetched'] <= ttl:
+                return []
+            table['prefetched'] = None
+            self.log('prefetched table %s/%s (vdom: %s) expired' % (path, name, vdom))
+        return None
+
+    def cache_lookup(self, path, name, vdom, mkey, results):
+        table = self._get_lookup_table(path, name, vdom)
+        table['objects'][str(mkey)] = {'time': time.time(), 'results': results}
+
+    def set_prefetched_table(self, path, name, vdom, mkeyname, objects):
+        now = time.time()
+        table = self._get_lookup_table(path, name, vdom)
+        table['prefetched'] = now
+        table['objects'] = dict((str(item[mkeyname]), {'time': now, 'results': [item]}) for item in objects if mkeyname in item)
+        self.log('prefetched table %s/%s (vdom: %s): %d objects' % (path, name, vdom, len(objects)))
+
+    def _system_version_cache_key(self):
+        return '%s:%s' % (self._conn.get_option('host'), self._conn.get_option('port'))
+
+    def _system_version_cache_file(self):
+        cache_file = self._get_plugin_option('system_version_cache_file', None)
+        if not cache_file or self._get_plugin_option('system_version_cache_ttl', 600) <= 0:
+            return None
+        return os.path.expanduser(cache_file)
+
+    def _read_system_version_cache(self, cache_file):
+        try:
+            with open(cache_file) as cache:
+                return cache_file, json.load(cache)
+        except (IOError, OSError, ValueError):
+            return cache_file, dict()
+
+    def _get_cached_system_version(self):
+        cache_file = self._system_version_cache_file()
+        if not cache_file:
+            return None
+        dummy, cache = self._read_system_version_cache(cache_file)
+        entry = cache.get(self._system_version_cache_key())
+        if not entry or time.time() - entry.get('time', 0) > self._get_plugin_option('system_version_cache_ttl', 600):
+            return None
+        return entry.get('version')
+
+    def _cache_system_version(self, version):
+        cache_file = self._system_version_cache_file()
+        if not cache_file:
+            return
+        dummy, cache = self._read_system_version_cache(cache_file)
+        cache[self._system_version_cache_key()] = {'version': version, 'time': time.time()}
+        temporary_file = '%s.%d' % (cache_file, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            with open(temporary_file, 'w') as cache_output:
+                json.dump(cache, cache_output)
+            os.rename(temporary_file, cache_file)
+        except (IOError, OSError) as err:
+            self.log('failed to cache system version: %s' % (to_text(err)))
+
+    def _learn_system_version(self, result):
+        # every response of the REST API carries the firmware version
+        try:
+            version = json.loads(result).get('version')
+        except (ValueError, AttributeError):
+            return
+        if version:
+            self._system_version = version
+            self._cache_system_version(version)
+            self.log('system version: %s' % (self._system_version))
+
     def update_system_version(self):
         """
         retrieve the system status of fortigate device
@@ -204,11 +776,14 @@ class HttpApi(HttpApiBase):
         check_system_status = self._conn.get_option('check_system_status') if 'check_system_status' in self._conn._options else True
         if not check_system_status or self._system_version:
             return
-        url = '/api/v2/cmdb/system/interface?vdom=root&action=schema'
-        status, result = self.send_request(url=url)
-        result_json = json.loads(result)
-        self._system_version = result_json.get('version', 'undefined')
-        self.log('system version: %s' % (self._system_version))
+        self._system_version = self._get_cached_system_version()
+        if self._system_version:
+            self.log('system version: %s (cached)' % (self._system_version))
+            return
+        status, result = self.send_request(url=SYSTEM_STATUS_URL)
+        self._learn_system_version(result)
+        if not self._system_version:
+            self._system_version = 'undefined'
         self.log('ansible version: %s' % (self._ansible_fos_version))
 
     def get_system_version(self):
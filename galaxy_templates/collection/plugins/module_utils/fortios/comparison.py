@@ -1,9 +1,14 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 import re
+from collections import Counter
+
+from ansible.module_utils.six import string_types
 
 
 IP_PREFIX = re.compile("^\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}")
+IP_ADDRESS = re.compile("^\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}$")
+MISSING = object()
 
 
 def bits(netmask):
@@ -14,82 +19,114 @@ def bits(netmask):
     return count
 
 
-def is_same_ip_address(current_ip, applied_ip):
-
-    if len(current_ip) == 0 and len(applied_ip) == 0:
-        return True
-    if len(current_ip) == 0 or len(applied_ip) == 0:
-        return False
-    if len(current_ip) == 1 and ' ' not in applied_ip and '/' not in applied_ip:
-        return current_ip[0] == applied_ip
-
-    splitted_applied_ip = []
-    total_bits_current_ip = 0
-    total_bits_applied_ip = 0
+def normalize_ip_address(data):
+    """
+    Turn 'address netmask', 'address/netmask' and 'address/length' into 'address/length',
+    None if data is not an IPv4 address with a contiguous netmask.
+    """
+    separator = ' ' if ' ' in data else '/'
+    parts = data.split(separator)
+    if len(parts) != 2 or not IP_ADDRESS.match(parts[0]):
+        return None
+    netmask = parts[1]
+    if netmask.isdigit():
+        return '%s/%d' % (parts[0], int(netmask)) if int(netmask) <= 32 else None
+    if not IP_ADDRESS.match(netmask):
+        return None
+    octets = [int(octet) for octet in netmask.split('.')]
+    if max(octets) > 255:
+        return None
+    value = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    length = bits(value)
+    if value != ((1 << length) - 1) << (32 - length):
+        # wildcard masks are compared as plain strings
+        return None
+    return '%s/%d' % (parts[0], length)
+
+
+def freeze(data):
+    """
+    A hashable form of data, in which the order of dictionary keys and list items does not matter.
+    """
+    if isinstance(data, dict):
+        return frozenset((key, freeze(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return frozenset(Counter(freeze(item) for item in data).items())
+    return data
 
-    if ' ' in applied_ip:
-        splitted_applied_ip = applied_ip.split(' ')
-    elif '/' in applied_ip:
-        splitted_applied_ip = applied_ip.split('/')
 
-    if current_ip[0] != splitted_applied_ip[0]:
-        return False
-    else:
-        if '.' in current_ip[1]:
-            total_bits_current_ip = sum([bits(int(s)) for s in current_ip[1].split('.')])
+def __concat_path(path, key):
+    return '%s.%s' % (path, key) if path else str(key)
+
+
+def __collect_member_changes(current, desired, path, changes):
+    # members are matched as a multiset, each current member is used at most once.
+    key_sets = set(frozenset(member.keys()) for member in desired)
+    is_flat = all(not isinstance(value, (dict, list)) for member in desired for value in member.values())
+    if is_flat and len(key_sets) == 1:
+        keys = list(desired[0].keys())
+        available = Counter(tuple(freeze(member.get(key, MISSING)) for key in keys)
+                            for member in current if isinstance(member, dict))
+        for index, member in enumerate(desired):
+            frozen_member = tuple(member[key] for key in keys)
+            if available[frozen_member] > 0:
+                available[frozen_member] -= 1
+            else:
+                changes.append('%s[%d]' % (path, index))
+        return
+
+    # the most specific members are matched first, a member with fewer attributes
+    # would otherwise take the only current member a more specific one matches.
+    unmatched = list(range(len(current)))
+    missing = list()
+    for index in sorted(range(len(desired)), key=lambda index: len(desired[index]), reverse=True):
+        for position, current_index in enumerate(unmatched):
+            if not find_changed_paths(current[current_index], desired[index]):
+                del unmatched[position]
+                break
         else:
-            total_bits_current_ip = int(current_ip[1])
-
-        if '.' in splitted_applied_ip[1]:
-            total_bits_applied_ip = sum([bits(int(s)) for s in splitted_applied_ip[1].split('.')])
-        else:
-            total_bits_applied_ip = int(splitted_applied_ip[1])
-
-        return total_bits_current_ip == total_bits_applied_ip
+            missing.append(index)
+    changes.extend('%s[%d]' % (path, index) for index in sorted(missing))
+
+
+def __collect_changes(current, desired, path, changes):
+    if isinstance(desired, dict):
+        if not isinstance(current, dict):
+            changes.append(path)
+            return
+        for key, value in desired.items():
+            key_path = __concat_path(path, key)
+            if key not in current:
+                changes.append(key_path)
+            else:
+                __collect_changes(current[key], value, key_path, changes)
+    elif isinstance(desired, list):
+        if not isinstance(current, list) or len(current) != len(desired):
+            changes.append(path)
+        elif desired and all(isinstance(member, dict) for member in desired):
+            __collect_member_changes(current, desired, path, changes)
+        elif Counter(freeze(item) for item in current) != Counter(freeze(item) for item in desired):
+            changes.append(path)
+    elif current != desired:
+        changes.append(path)
+
+
+def find_changed_paths(current, desired):
+    """
+    List the paths of the attributes in desired which differ from current,
+    attributes only present in current are ignored.
+    Both are expected to be serialized.
+    """
+    changes = list()
+    __collect_changes(current, desired, '', changes)
+    return changes
 
 
 def is_same_comparison(reorder_current, reorder_filtered):
-    for key, value in reorder_filtered.items():
-        if key not in reorder_current:
-            return False
-
-        if type(value) == dict:
-            if not is_same_comparison(reorder_current[key], value):
-                return False
-        elif type(value) == list:
-            if len(value) != len(reorder_current[key]):
-                return False
-            if type(value[0]) == dict:
-                for current_dict in reorder_current[key]:
-                    if not is_same_comparison(current_dict, value[0]):
-                        return False
-            elif reorder_current[key] != value:
-                return False
-        elif type(value) == str and IP_PREFIX.match(value):
-            return is_same_ip_address(reorder_current[key], value)
-
-        elif reorder_current[key] != value:
-            return False
-
-    return True
+    return not find_changed_paths(reorder_current, reorder_filtered)
 
 
 def serialize(data):
-    if type(data) == str and ' ' in data:
-        return serialize(data.split(' '))
-    if type(data) == list and len(data) > 0:
-        if type(data[0]) == dict:
-            list_to_order = []
-            for dt in data:
-                ret = {}
-                for key, value in dt.items():
-                    ret[key] = serialize(value)
-                list_to_order.append(ret)
-
-            return sorted(list_to_order, key=lambda dt: str(dt.items()))
-        else:
-            return sorted(data)
-
     if type(data) == dict:
         result = {}
         for key, value in data.items():
@@ -97,4 +134,20 @@ def serialize(data):
 
         return result
 
+    if type(data) == list and len(data) > 0:
+        if type(data[0]) == dict:
+            # the members are compared regardless of their order, no need to sort them
+            return [serialize(item) for item in data]
+        else:
+            return sorted(data)
+
+    if isinstance(data, string_types) and (' ' in data or '/' in data):
+        if IP_PREFIX.match(data):
+            # normalized once here, the comparison is then a plain equality
+            ip_address = normalize_ip_address(data)
+            if ip_address:
+                return ip_address
+        if ' ' in data:
+            return serialize(data.split(' '))
+
     return data
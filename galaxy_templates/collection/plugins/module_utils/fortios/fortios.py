@@ -32,10 +32,14 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import base64
+import bisect
 import os
 import time
 import traceback
+import zlib
 
+from ansible.module_utils._text import to_bytes
 from ansible.module_utils._text import to_text
 from ansible.module_utils.basic import env_fallback
 from ansible.module_utils.basic import _load_params
@@ -88,6 +92,13 @@ def check_legacy_fortiosapi():
         sys.exit(1)
 
 
+def load_compact_schema(data):
+    """
+    Decode a schema the generator embedded as zlib compressed JSON in base64.
+    """
+    return json.loads(to_text(zlib.decompress(base64.b64decode(data))))
+
+
 def schema_to_module_spec(schema):
     rdata = dict()
     if 'type' not in schema:
@@ -167,15 +178,90 @@ def __check_version(revisions, version):
     return result
 
 
+def __version_key(version):
+    return tuple(int(number) for number in version.lstrip('v').split('.'))
+
+
+def __resolve_version(versioned_schema, version):
+    # locate the running version among the pre-sorted versions of the module once,
+    # the revision bitmaps of every node are then checked against that position.
+    resolved = dict()
+    resolved['version'] = version
+    if 'revision_versions' not in versioned_schema:
+        return resolved
+    try:
+        version_key = __version_key(version)
+    except (AttributeError, ValueError):
+        return resolved
+    resolved['versions'] = versioned_schema['revision_versions']
+    resolved['position'] = bisect.bisect_right([__version_key(ver) for ver in resolved['versions']], version_key)
+    return resolved
+
+
+def __lowest_bit(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+def __check_revision_bits(present, supported, versions, position):
+    result = dict()
+    preceding = present & ((1 << position) - 1)
+    if not preceding:
+        # even it's not supported in earliest version
+        result['supported'] = False
+        result['reason'] = 'not supported until in %s' % (versions[__lowest_bit(present)])
+        return result
+    nearest = preceding.bit_length() - 1
+    if supported >> nearest & 1:
+        result['supported'] = True
+        return result
+    earlier = supported & ((1 << nearest) - 1)
+    later = supported >> (nearest + 1) << (nearest + 1)
+    earliest = earlier.bit_length() - 1 if earlier else __lowest_bit(present)
+    if not later:
+        result['reason'] = 'not supported since %s' % (versions[earliest])
+    else:
+        result['reason'] = 'not supported since %s, before %s' % (versions[earliest], versions[__lowest_bit(later)])
+    result['supported'] = False
+    return result
+
+
+def __check_schema_version(schema, resolved):
+    if 'versions' not in resolved or 'revision_present' not in schema:
+        return __check_version(schema['revisions'], resolved['version'])
+    return __check_revision_bits(schema['revision_present'], schema['revision_supported'],
+                                 resolved['versions'], resolved['position'])
+
+
+def __format_trace_item(item):
+    if type(item) is not tuple:
+        return str(item)
+    key, value = item
+    if key is None:
+        return '[%s]' % (value)
+    return '%s(%s)' % (key, value) if type(value) in [int, bool, str] else key
+
+
 def __concat_attribute_sequence(trace_path):
-    rdata = ''
+    # the trace items are only formatted once a mismatch is reported
     if type(trace_path) is not list:
         raise AssertionError()
-    if len(trace_path) >= 1:
-        rdata += str(trace_path[0])
-    for item in trace_path[1:]:
-        rdata += '.' + str(item)
-    return rdata
+    return '.'.join(__format_trace_item(item) for item in trace_path)
+
+
+def __check_option_versions(results, trace, schema, params, version):
+    option_revisions = schema['option_revisions']
+    for param in params:
+        if type(param) not in [int, bool, str]:
+            raise AssertionError()
+        option_key = str(param)
+        if option_key not in option_revisions:
+            raise AssertionError()
+        present, supported = option_revisions[option_key]
+        matched = __check_revision_bits(present, supported, version['versions'], version['position'])
+        if matched['supported'] is False:
+            trace.append((None, param))
+            results['mismatches'].append('option %s %s' % (__concat_attribute_sequence(trace), matched['reason']))
+            del trace[-1]
 
 
 def check_schema_versioning_internal(results, trace, schema, params, version):
@@ -183,8 +269,10 @@ def check_schema_versioning_internal(results, trace, schema, params, version):
         return
     if 'revisions' not in schema:
         raise AssertionError()
-    revision = schema['revisions']
-    matched = __check_version(revision, version)
+    if 'position' in version and 'revision_subtree' in schema and schema['revision_subtree'] >> version['position'] & 1:
+        # the attribute and everything below it is supported by the system
+        return
+    matched = __check_schema_version(schema, version)
     if matched['supported'] is False:
         results['mismatches'].append('option %s %s' % (__concat_attribute_sequence(trace), matched['reason']))
 
@@ -202,10 +290,11 @@ def check_schema_versioning_internal(results, trace, schema, params, version):
                     raise AssertionError()
                 for key in list_item:
                     value = list_item[key]
-                    key_string = '%s(%s)' % (key, value) if type(value) in [int, bool, str] else key
-                    trace.append(key_string)
+                    trace.append((key, value))
                     check_schema_versioning_internal(results, trace, schema['children'][key], value, version)
                     del trace[-1]
+        elif 'options' in schema and 'position' in version and 'option_revisions' in schema:
+            __check_option_versions(results, trace, schema, params, version)
         elif 'options' in schema:
             for param in params:
                 if type(param) not in [int, bool, str]:
@@ -217,7 +306,7 @@ def check_schema_versioning_internal(results, trace, schema, params, version):
                         break
                 if not target_option:
                     raise AssertionError()
-                trace.append('[%s]' % param)
+                trace.append((None, param))
                 check_schema_versioning_internal(results, trace, target_option, param, version)
                 del trace[-1]
     elif schema['type'] == 'dict':
@@ -228,8 +317,7 @@ def check_schema_versioning_internal(results, trace, schema, params, version):
                 dict_item_value = params[dict_item_key]
                 if dict_item_key not in schema['children']:
                     raise AssertionError()
-                key_string = '%s(%s)' % (dict_item_key, dict_item_value) if type(dict_item_value) in [int, bool, str] else dict_item_key
-                trace.append(key_string)
+                trace.append((dict_item_key, dict_item_value))
                 check_schema_versioning_internal(results, trace, schema['children'][dict_item_key], dict_item_value, version)
                 del trace[-1]
     else:
@@ -250,21 +338,33 @@ def check_schema_versioning(fos, versioned_schema, top_level_param):
         # in case no top level parameters are given.
         # see module: fortios_firewall_policy
         return results
-    module_revisions = versioned_schema['revisions']
-    module_matched = __check_version(module_revisions, system_version)
+    resolved_version = __resolve_version(versioned_schema, system_version)
+    module_matched = __check_schema_version(versioned_schema, resolved_version)
     if module_matched['supported'] is False:
         results['matched'] = False
         results['mismatches'].append('module fortios_%s %s' % (top_level_param, module_matched['reason']))
         return results
+    if 'position' in resolved_version and versioned_schema.get('revision_subtree', 0) >> resolved_version['position'] & 1:
+        # every attribute of the module is supported by the system
+        return results
 
-    for param_name in params:
-        param_value = params[param_name]
-        if not param_value or param_name not in versioned_schema['children']:
-            continue
-        key_string = '%s(%s)' % (param_name, param_value) if type(param_value) in [int, bool, str] else param_name
-        trace.append(key_string)
-        check_schema_versioning_internal(results, trace, versioned_schema['children'][param_name], param_value, system_version)
-        del trace[-1]
+    # the bulk option lists several objects, each of them is checked as the single object option
+    if type(params) is list:
+        objects = [('[%d]' % (index), item) for index, item in enumerate(params)]
+    else:
+        objects = [(None, params)]
+    for object_trace, object_params in objects:
+        if object_trace:
+            trace.append(object_trace)
+        for param_name in object_params:
+            param_value = object_params[param_name]
+            if not param_value or param_name not in versioned_schema['children']:
+                continue
+            trace.append((param_name, param_value))
+            check_schema_versioning_internal(results, trace, versioned_schema['children'][param_name], param_value, resolved_version)
+            del trace[-1]
+        if object_trace:
+            del trace[-1]
     if len(results['mismatches']):
         results['matched'] = False
 
@@ -280,6 +380,91 @@ class FortiOSHandler(object):
         self._conn = conn
         self._module = mod
         self._mkeyname = module_mkeyname
+        self._mkey_cache_enabled = None
+        self._check_mode_cache_enabled = None
+        self._check_mode_prefetch_enabled = None
+        self._request_trace = None
+        self._put_post_fallbacks = 0
+
+
+    def enable_request_stats(self):
+        """
+        Record the latency, size and status of every request sent by this handler.
+        """
+        self._request_trace = list()
+
+
+    def __record_request(self, method, url, data, status, result_data, latency):
+        if self._request_trace is None:
+            return
+        self._request_trace.append({
+            'method': method,
+            'url': url,
+            'status': status,
+            'latency_ms': round(latency * 1000, 3),
+            'bytes_sent': len(to_bytes(data)) if data else 0,
+            'bytes_received': len(to_bytes(result_data)) if result_data else 0,
+        })
+
+
+    def __send_request(self, url, method='GET', data=None, params=None, **kwargs):
+        started = time.time()
+        status, result_data = self._conn.send_request(url=url, params=params, data=data, method=method, **kwargs)
+        self.__record_request(method, url, data, status, result_data, time.time() - started)
+        return status, result_data
+
+
+    def get_request_stats(self):
+        """
+        Aggregate the recorded requests per status code and per endpoint,
+        an endpoint being the method and the url without its query string.
+        """
+        if self._request_trace is None:
+            return None
+        stats = {
+            'requests': len(self._request_trace),
+            'latency_ms': 0,
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'status_codes': dict(),
+            'put_post_fallbacks': self._put_post_fallbacks,
+            'endpoints': dict(),
+        }
+        for record in self._request_trace:
+            endpoint_name = '%s %s' % (record['method'], record['url'].split('?')[0])
+            endpoint = stats['endpoints'].setdefault(endpoint_name, {
+                'requests': 0,
+                'latency_ms': 0,
+                'max_latency_ms': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+            })
+            for totals in [stats, endpoint]:
+                totals['latency_ms'] += record['latency_ms']
+                totals['bytes_sent'] += record['bytes_sent']
+                totals['bytes_received'] += record['bytes_received']
+            endpoint['requests'] += 1
+            endpoint['max_latency_ms'] = max(endpoint['max_latency_ms'], record['latency_ms'])
+            status_code = str(record['status'])
+            stats['status_codes'][status_code] = stats['status_codes'].get(status_code, 0) + 1
+        stats['latency_ms'] = round(stats['latency_ms'], 3)
+        for endpoint in stats['endpoints'].values():
+            endpoint['latency_ms'] = round(endpoint['latency_ms'], 3)
+        return stats
+
+
+    def export_request_stats(self, report=False, trace_file=None):
+        """
+        Write the request trace to trace_file and return the keyword arguments
+        which add the aggregated stats to the module result when report is set.
+        """
+        if self._request_trace is None:
+            return dict()
+        stats = self.get_request_stats()
+        if trace_file:
+            with open(os.path.expanduser(trace_file), 'w') as f:
+                json.dump({'stats': stats, 'requests': self._request_trace}, f, indent=2, sort_keys=True)
+        return dict(request_stats=stats) if report else dict()
 
 
     def cmdb_url(self, path, name, vdom=None, mkey=None):
@@ -320,7 +505,7 @@ class FortiOSHandler(object):
         else:
             url = self.cmdb_url(path, name, vdom=vdom) + "&action=schema"
 
-        status, result_data = self._conn.send_request(url=url)
+        status, result_data = self.__send_request(url=url)
 
         if status == 200:
             if vdom == "global":
@@ -352,7 +537,7 @@ class FortiOSHandler(object):
         slash_index = url.find('/')
         full_url = self.log_url(url[: slash_index], url[slash_index + 1:])
 
-        status, result_data = self._conn.send_request(url=full_url, params=parameters, method='GET')
+        status, result_data = self.__send_request(url=full_url, params=parameters, method='GET')
 
         return self.formatresponse(result_data)
 
@@ -360,7 +545,7 @@ class FortiOSHandler(object):
     def monitor_get(self, url, vdom=None, parameters=None):
         slash_index = url.find('/')
         full_url = self.mon_url(url[: slash_index], url[slash_index + 1:], vdom)
-        status, result_data = self._conn.send_request(url=full_url, params=parameters, method='GET')
+        status, result_data = self.__send_request(url=full_url, params=parameters, method='GET')
         return self.formatresponse(result_data, vdom=vdom)
 
 
@@ -368,7 +553,7 @@ class FortiOSHandler(object):
         slash_index = url.find('/')
         url = self.mon_url(url[: slash_index], url[slash_index + 1:], vdom)
 
-        status, result_data = self._conn.send_request(url=url, params=parameters, data=json.dumps(data), method='POST')
+        status, result_data = self.__send_request(url=url, params=parameters, data=json.dumps(data), method='POST')
 
         return self.formatresponse(result_data, vdom=vdom)
 
@@ -376,15 +561,68 @@ class FortiOSHandler(object):
     def get(self, path, name, vdom=None, mkey=None, parameters=None):
         url = self.cmdb_url(path, name, vdom, mkey=mkey)
 
-        status, result_data = self._conn.send_request(url=url, params=parameters, method='GET')
+        status, result_data = self.__send_request(url=url, params=parameters, method='GET')
 
+        if mkey and status in [200, 404]:
+            self.__learn_mkey(path, name, vdom, mkey, status == 200)
         return self.formatresponse(result_data, vdom=vdom)
 
 
+    def get_cached(self, path, name, vdom=None, mkey=None):
+        """
+        Same as get for one object, the lookups are cached by the connection per path, name,
+        vdom and mkey. With check_mode_prefetch the whole table is read on the first lookup.
+        """
+        mkeyname = self.get_mkeyname(path, name, vdom)
+        if mkey is None or not mkeyname or not self.__is_check_mode_cache_enabled():
+            return self.get(path, name, vdom=vdom, mkey=mkey)
+        results = self._conn.lookup_cached(path, name, vdom, mkey)
+        if results is None and self.__is_check_mode_prefetch_enabled():
+            resp = self.get(path, name, vdom=vdom)
+            if resp.get('http_status') == 200 and type(resp.get('results')) is list:
+                self._conn.set_prefetched_table(path, name, vdom, mkeyname, resp['results'])
+                results = [item for item in resp['results'] if mkeyname in item and str(item[mkeyname]) == str(mkey)][:1]
+        if results is None:
+            resp = self.get(path, name, vdom=vdom, mkey=mkey)
+            if resp.get('http_status') == 200 and type(resp.get('results')) is list:
+                self._conn.cache_lookup(path, name, vdom, mkey, resp['results'][:1])
+            elif resp.get('http_status') == 404:
+                self._conn.cache_lookup(path, name, vdom, mkey, [])
+            return resp
+        resp = dict()
+        resp['http_method'] = 'GET'
+        resp['http_status'] = 200 if results else 404
+        resp['status'] = 'success' if results else 'error'
+        resp['results'] = results
+        resp['vdom'] = vdom
+        return resp
+
+
+    def get_many(self, requests, max_workers=4):
+        """
+        Retrieve several tables or objects at once, each request is a dictionary
+        with path, name and optionally vdom, mkey and parameters.
+        """
+        return [response for response, latency in self.get_many_timed(requests, max_workers)]
+
+
+    def get_many_timed(self, requests, max_workers=4):
+        """
+        Same as get_many, each response comes with the latency of its request in seconds.
+        """
+        urls = [{'url': self.cmdb_url(request['path'], request['name'], request.get('vdom'), mkey=request.get('mkey')),
+                 'params': request.get('parameters')} for request in requests]
+        responses = self._conn.send_requests(urls, max_workers)
+        for url, (status, result_data, latency) in zip(urls, responses):
+            self.__record_request('GET', url['url'], None, status, result_data, latency)
+        return [(self.formatresponse(result_data, vdom=request.get('vdom')), latency)
+                for request, (status, result_data, latency) in zip(requests, responses)]
+
+
     def monitor(self, path, name, vdom=None, mkey=None, parameters=None):
         url = self.mon_url(path, name, vdom, mkey)
 
-        status, result_data = self._conn.send_request(url=url, params=parameters, method='GET')
+        status, result_data = self.__send_request(url=url, params=parameters, method='GET')
 
         return self.formatresponse(result_data, vdom=vdom)
 
@@ -393,16 +631,25 @@ class FortiOSHandler(object):
 
         if not mkey:
             mkey = self.get_mkey(path, name, data, vdom=vdom)
+        is_move = parameters and 'action' in parameters and parameters['action'] == 'move'
+        if not is_move and mkey and self.__lookup_mkey(path, name, vdom, mkey) is False:
+            # known to be a new object, skip the PUT attempt
+            return self.post(path, name, data, vdom, mkey)
         url = self.cmdb_url(path, name, vdom, mkey)
 
-        status, result_data = self._conn.send_request(url=url, params=parameters, data=json.dumps(data), method='PUT')
+        status, result_data = self.__send_request(url=url, params=parameters, data=json.dumps(data), method='PUT')
 
-        if parameters and 'action' in parameters and parameters['action'] == 'move':
+        if is_move:
             return self.formatresponse(result_data, vdom=vdom)
 
         if status == 404 or status == 405 or status == 500:
+            self._put_post_fallbacks += 1
             return self.post(path, name, data, vdom, mkey)
         else:
+            if status == 200:
+                self.__learn_mkey(path, name, vdom, mkey, True)
+            else:
+                self.__invalidate_mkey_index(path, name, vdom)
             return self.formatresponse(result_data, vdom=vdom)
 
 
@@ -415,8 +662,12 @@ class FortiOSHandler(object):
 
         url = self.cmdb_url(path, name, vdom, mkey=None)
 
-        status, result_data = self._conn.send_request(url=url, params=parameters, data=json.dumps(data), method='POST')
+        status, result_data = self.__send_request(url=url, params=parameters, data=json.dumps(data), method='POST')
 
+        if status == 200:
+            self.__learn_mkey(path, name, vdom, mkey or self.get_mkey(path, name, data, vdom=vdom), True)
+        else:
+            self.__invalidate_mkey_index(path, name, vdom)
         return self.formatresponse(result_data, vdom=vdom)
 
 
@@ -424,7 +675,7 @@ class FortiOSHandler(object):
                 mkey=None, parameters=None, timeout=300):
         url = self.mon_url(path, name, vdom, mkey=mkey)
 
-        status, result_data = self._conn.send_request(url=url, params=parameters, data=json.dumps(data), method='POST', timeout=timeout)
+        status, result_data = self.__send_request(url=url, params=parameters, data=json.dumps(data), method='POST', timeout=timeout)
 
         return self.formatresponse(result_data, vdom=vdom)
 
@@ -433,10 +684,113 @@ class FortiOSHandler(object):
         if not mkey:
             mkey = self.get_mkey(path, name, data, vdom=vdom)
         url = self.cmdb_url(path, name, vdom, mkey)
-        status, result_data = self._conn.send_request(url=url, params=parameters, data=json.dumps(data), method='DELETE')
+        status, result_data = self.__send_request(url=url, params=parameters, data=json.dumps(data), method='DELETE')
+        if status == 200 or status == 404:
+            self.__learn_mkey(path, name, vdom, mkey, False)
+        else:
+            self.__invalidate_mkey_index(path, name, vdom)
         return self.formatresponse(result_data, vdom=vdom)
 
 
+    def __get_table_mkeys(self, path, name, vdom=None):
+        mkeyname = self.get_mkeyname(path, name, vdom)
+        if not mkeyname:
+            return None
+        resp = self.get(path, name, vdom=vdom, parameters={'format': mkeyname})
+        if resp.get('http_status') != 200 or type(resp.get('results')) is not list:
+            return None
+        mkeys = set(str(item[mkeyname]) for item in resp['results'] if mkeyname in item)
+        if self.__is_mkey_cache_enabled():
+            self._conn.set_mkey_index(path, name, vdom, list(mkeys))
+        return mkeys
+
+
+    def __is_mkey_cache_enabled(self):
+        if self._mkey_cache_enabled is None:
+            self._mkey_cache_enabled = bool(self._conn.mkey_cache_enabled())
+        return self._mkey_cache_enabled
+
+
+    def __lookup_mkey(self, path, name, vdom, mkey):
+        """
+        Whether an object exists according to the mkey index of the connection,
+        the table is indexed with one GET the first time, None if unknown.
+        """
+        if not self.__is_mkey_cache_enabled():
+            return None
+        existed = self._conn.lookup_mkey(path, name, vdom, mkey)
+        if existed is None:
+            mkeys = self.__get_table_mkeys(path, name, vdom)
+            existed = str(mkey) in mkeys if mkeys is not None else None
+        return existed
+
+
+    def __learn_mkey(self, path, name, vdom, mkey, existed):
+        if mkey and self.__is_mkey_cache_enabled():
+            self._conn.learn_mkey(path, name, vdom, mkey, existed)
+
+
+    def __invalidate_mkey_index(self, path, name, vdom):
+        if self.__is_mkey_cache_enabled():
+            self._conn.invalidate_mkey_index(path, name, vdom)
+
+
+    def __is_check_mode_cache_enabled(self):
+        if self._check_mode_cache_enabled is None:
+            self._check_mode_cache_enabled = bool(self._conn.check_mode_cache_enabled())
+        return self._check_mode_cache_enabled
+
+
+    def __is_check_mode_prefetch_enabled(self):
+        if self._check_mode_prefetch_enabled is None:
+            self._check_mode_prefetch_enabled = bool(self._conn.check_mode_prefetch_enabled())
+        return self._check_mode_prefetch_enabled
+
+
+    def __bulk_response(self, method, results):
+        resp = dict()
+        resp['http_method'] = method
+        resp['results'] = results
+        resp['http_status'] = 200
+        resp['status'] = 'success'
+        resp['revision_changed'] = False
+        for result in results:
+            if result['status'] != 'success' and not (result.get('http_method') == 'DELETE' and result.get('http_status') == 404):
+                if resp['status'] == 'success':
+                    resp['http_status'] = result.get('http_status')
+                resp['status'] = 'error'
+            if result['status'] == 'success' and result.get('revision_changed', True):
+                resp['revision_changed'] = True
+        return resp
+
+
+    def bulk_set(self, path, name, data_list, vdom=None, parameters=None):
+        """
+        Create or update the objects of a table, the mkeys present in the table are
+        fetched once so that each object takes one PUT or one POST.
+        """
+        existing_mkeys = self.__get_table_mkeys(path, name, vdom)
+        results = list()
+        for data in data_list:
+            mkey = self.get_mkey(path, name, data, vdom=vdom)
+            if existing_mkeys is not None and mkey is not None and str(mkey) not in existing_mkeys:
+                result = self.post(path, name, data, vdom, mkey, parameters)
+            else:
+                result = self.set(path, name, data, mkey=mkey, vdom=vdom, parameters=parameters)
+            result['mkey'] = mkey
+            results.append(result)
+        return self.__bulk_response('PUT', results)
+
+
+    def bulk_delete(self, path, name, mkeys, vdom=None, parameters=None):
+        results = list()
+        for mkey in mkeys:
+            result = self.delete(path, name, vdom=vdom, mkey=mkey, parameters=parameters)
+            result['mkey'] = mkey
+            results.append(result)
+        return self.__bulk_response('DELETE', results)
+
+
     def __to_local(self, data, is_array=False):
         try:
             resp = json.loads(data)
@@ -475,7 +829,7 @@ class FortiOSHandler(object):
             else:
                 url += "?"
             url += specific_params
-        status, result_data = self._conn.send_request(url=url, method=method, data=json.dumps(data), params=parameters)
+        status, result_data = self.__send_request(url=url, method=method, data=json.dumps(data), params=parameters)
         return self.formatresponse(result_data, vdom=vdom)
 
 # BEGIN DEPRECATED
@@ -0,0 +1,157 @@
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+import hashlib
+import json
+import os
+import re
+import time
+
+from ansible.module_utils._text import to_bytes
+
+from ansible_collections.fortinet.fortios.plugins.module_utils.fortios.comparison import find_changed_paths
+from ansible_collections.fortinet.fortios.plugins.module_utils.fortios.comparison import serialize
+
+
+UNSAFE_CHARACTERS = re.compile('[^A-Za-z0-9_.-]')
+
+# an object is stored before the table referencing it, younger objects may belong to a refresh in progress
+PRUNE_MIN_AGE = 3600
+
+
+def object_hash(data):
+    return hashlib.sha256(to_bytes(json.dumps(data, sort_keys=True, separators=(',', ':')))).hexdigest()
+
+
+def find_drifted_paths(previous, current):
+    """
+    The attributes which differ between two versions of an object, in either direction,
+    empty when they only differ by the order of their members.
+    """
+    previous = serialize(previous)
+    current = serialize(current)
+    return sorted(set(find_changed_paths(previous, current)) | set(find_changed_paths(current, previous)))
+
+
+class SnapshotStore(object):
+    """
+    Local store of the configuration objects of several devices.
+
+    Every object is kept once under its hash, in objects/<hash[:2]>/<hash>.json,
+    and each table only records the hash of its objects per mkey, in
+    tables/<device>/<vdom>/<table>.json. Comparing a table against its previous
+    version is then a comparison of hashes, only the objects whose hash changed
+    are loaded and compared attribute by attribute.
+    """
+
+    def __init__(self, root):
+        self._root = root
+
+
+    def __write_file(self, path, data):
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # created meanwhile by a concurrent refresh
+                if not os.path.isdir(folder):
+                    raise
+        temporary_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary_path, 'wb') as f:
+            f.write(to_bytes(data))
+        os.rename(temporary_path, path)
+
+
+    def __object_path(self, digest):
+        return os.path.join(self._root, 'objects', digest[:2], digest + '.json')
+
+
+    def __table_path(self, device, vdom, table):
+        return os.path.join(self._root, 'tables', UNSAFE_CHARACTERS.sub('_', str(device)),
+                            UNSAFE_CHARACTERS.sub('_', str(vdom)), UNSAFE_CHARACTERS.sub('_', table) + '.json')
+
+
+    def load_object(self, digest):
+        with open(self.__object_path(digest), 'r') as f:
+            return json.load(f)
+
+
+    def store_object(self, data):
+        digest = object_hash(data)
+        path = self.__object_path(digest)
+        if not os.path.exists(path):
+            self.__write_file(path, json.dumps(data, sort_keys=True))
+        else:
+            # referenced again, keep it out of the reach of a concurrent prune
+            os.utime(path, None)
+        return digest
+
+
+    def load_table(self, device, vdom, table):
+        """
+        The hashes of the objects of a table per mkey, None if the table was never stored.
+        """
+        path = self.__table_path(device, vdom, table)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+
+    def store_table(self, device, vdom, table, hashes):
+        self.__write_file(self.__table_path(device, vdom, table), json.dumps(hashes, indent=1, sort_keys=True))
+
+
+    def refresh_table(self, device, vdom, table, objects):
+        """
+        Store the current objects of a table, objects being a dictionary of objects per mkey,
+        and report how the table drifted from its previously stored version.
+        """
+        previous = self.load_table(device, vdom, table)
+        hashes = dict()
+        drift = {'added': [], 'removed': [], 'changed': {}, 'unchanged': 0, 'baseline': previous is None}
+        for mkey, data in objects.items():
+            digest = self.store_object(data)
+            hashes[mkey] = digest
+            if previous is None:
+                continue
+            previous_digest = previous.get(mkey)
+            if previous_digest is None:
+                drift['added'].append(mkey)
+            elif previous_digest == digest:
+                drift['unchanged'] += 1
+            else:
+                changed_paths = find_drifted_paths(self.load_object(previous_digest), data)
+                if changed_paths:
+                    drift['changed'][mkey] = changed_paths
+                else:
+                    drift['unchanged'] += 1
+        if previous is not None:
+            drift['removed'] = sorted(mkey for mkey in previous if mkey not in hashes)
+            drift['added'].sort()
+        self.store_table(device, vdom, table, hashes)
+        return drift
+
+
+    def prune(self, min_age=PRUNE_MIN_AGE):
+        """
+        Delete the objects no table references any more and which are older than min_age seconds.
+        :return: the number of objects deleted.
+        """
+        referenced = set()
+        for folder, dummy, files in os.walk(os.path.join(self._root, 'tables')):
+            for file_name in files:
+                if file_name.endswith('.json'):
+                    with open(os.path.join(folder, file_name), 'r') as f:
+                        referenced.update(json.load(f).values())
+        deleted = 0
+        oldest = time.time() - min_age
+        # the prefix folders are kept even when empty, a concurrent refresh may be writing into them
+        for folder, dummy, files in os.walk(os.path.join(self._root, 'objects')):
+            for file_name in files:
+                path = os.path.join(folder, file_name)
+                if file_name.endswith('.json') and file_name[:-len('.json')] not in referenced \
+                        and os.path.getmtime(path) < oldest:
+                    os.remove(path)
+                    deleted += 1
+        return deleted
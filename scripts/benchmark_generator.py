@@ -0,0 +1,356 @@
+#! /usr/bin/python3
+"""
+Benchmark the whole generation pipeline against synthetic FortiOS schemas.
+
+The CMDB, monitor and log schemas are synthesized from a seed, so that a given
+set of arguments always produces the same input. The pipeline then runs in a
+scratch copy of the repository, each stage the way scripts/generate runs it:
+
+    merge      merge_schema.py and merge_monitor_schema.py (python3)
+    render     generate_modules.py (python2)
+    doc        generate_doc.py, one process per generated module (python3)
+
+The wall time and peak RSS of every stage are reported, and compared to the
+baseline of the same scenario when one was saved before:
+
+    ./scripts/benchmark_generator.py --tables 500 --versions 5 --save-baseline
+    ./scripts/benchmark_generator.py --tables 500 --versions 5 --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the sources the generator reads from its working directory
+PIPELINE_SOURCES = ['ansible_templates', 'scripts', 'galaxy_templates',
+                    'special_attributes.lst', 'valid_identifiers.lst', 'movable_modules.lst',
+                    'version_added.json', 'check_mode_support.txt']
+
+STAGES = ['synthesize', 'merge', 'render', 'doc']
+
+CMDB_PATHS = ['firewall', 'system', 'router', 'user', 'vpn_ipsec', 'wireless_controller']
+
+
+def synthesize_version(version_index):
+    # single digit components, merge_schema.py sorts the versions as strings
+    return 'v%d.%d.%d' % (6 + version_index // 9, version_index % 9 // 3 * 2, version_index % 3)
+
+
+def synthesize_attribute(name, attribute_type, rng, version_index):
+    attribute = {
+        'name': name,
+        'category': 'unitary',
+        'type': attribute_type,
+        'help': 'Synthetic %s attribute.' % (attribute_type),
+    }
+    if attribute_type == 'option':
+        # every version drops an option and introduces a new one
+        attribute['options'] = [{'name': 'option-%d' % (option_index), 'help': 'Synthetic option.'}
+                                for option_index in range(version_index, version_index + rng.randint(2, 8))]
+    elif attribute_type == 'integer':
+        attribute['min-value'] = 0
+        attribute['max-value'] = 4294967295
+    elif attribute_type in ['string', 'var-string']:
+        attribute['size'] = 35
+    return attribute
+
+
+def synthesize_cmdb_table(table_index, attributes, version_index, versions, rng):
+    children = dict()
+    children['name'] = synthesize_attribute('name', 'string', rng, version_index)
+    for attribute_index in range(attributes):
+        # a tenth of the attributes only exist in the later versions
+        if attribute_index % 10 == 9 and version_index < versions // 2:
+            continue
+        attribute_type = ['string', 'integer', 'option', 'var-string', 'ipv4-classnet'][attribute_index % 5]
+        attribute_name = 'attr-%d' % (attribute_index)
+        children[attribute_name] = synthesize_attribute(attribute_name, attribute_type, rng, version_index)
+    children['member'] = {
+        'name': 'member',
+        'category': 'table',
+        'help': 'Synthetic member table.',
+        'mkey': 'name',
+        'mkey_type': 'string',
+        'children': {
+            'name': synthesize_attribute('name', 'string', rng, version_index),
+            'weight': synthesize_attribute('weight', 'integer', rng, version_index),
+        },
+    }
+    children['settings'] = {
+        'name': 'settings',
+        'category': 'complex',
+        'help': 'Synthetic complex attribute.',
+        'children': {
+            'status': synthesize_attribute('status', 'option', rng, version_index),
+            'interval': synthesize_attribute('interval', 'integer', rng, version_index),
+        },
+    }
+    table_name = 'table%d' % (table_index)
+    schema = {
+        'name': table_name,
+        'category': 'table',
+        'help': 'Synthetic table.',
+        'mkey': 'name',
+        'mkey_type': 'string',
+        'children': children,
+    }
+    if table_index % 4 == 3:
+        # a few singletons, which have no mkey
+        schema['category'] = 'complex'
+        del schema['mkey']
+        del schema['mkey_type']
+    return {'path': CMDB_PATHS[table_index % len(CMDB_PATHS)], 'name': table_name, 'schema': schema}
+
+
+def synthesize_cmdb_schemas(tables, attributes, versions, seed):
+    schemas = list()
+    for version_index in range(versions):
+        rng = random.Random('%d-%d' % (seed, version_index))
+        schemas.append({
+            'version': synthesize_version(version_index),
+            'build': 1000 + version_index,
+            'results': [synthesize_cmdb_table(table_index, attributes, version_index, versions, rng)
+                        for table_index in range(tables)],
+        })
+    return schemas
+
+
+def synthesize_api_parameters(rng):
+    return [{'name': 'param-%d' % (param_index),
+             'type': rng.choice(['string', 'int', 'boolean', 'array']),
+             'summary': 'Synthetic parameter.',
+             'required': param_index == 0 and rng.random() < 0.3}
+            for param_index in range(rng.randint(0, 6))]
+
+
+def synthesize_monitor_schemas(endpoints, versions, seed):
+    schemas = list()
+    for version_index in range(versions):
+        rng = random.Random('%d-monitor-%d' % (seed, version_index))
+        directory = list()
+        for endpoint_index in range(endpoints):
+            directory.append({
+                'path': CMDB_PATHS[endpoint_index % len(CMDB_PATHS)],
+                'name': 'endpoint%d' % (endpoint_index),
+                'action': 'select' if endpoint_index % 3 else 'action%d' % (endpoint_index),
+                'summary': 'Synthetic monitor endpoint.',
+                'request': {
+                    'http_method': 'GET' if endpoint_index % 2 else 'POST',
+                    'parameters': synthesize_api_parameters(rng),
+                },
+            })
+        schemas.append({'version': synthesize_version(version_index), 'build': 1000 + version_index, 'directory': directory})
+    return schemas
+
+
+def synthesize_log_schema(endpoints, seed):
+    rng = random.Random('%d-log' % (seed))
+    # the names and actions generate_log_fact() expands
+    directory = [{'name': 'virus', 'action': 'archive'},
+                 {'name': ':type', 'action': 'archive'},
+                 {'name': ':type', 'action': 'raw'},
+                 {'name': ':type', 'action': '?subtype'}]
+    directory.extend({'name': ':type', 'action': 'action%d' % (endpoint_index)} for endpoint_index in range(endpoints))
+    for api_item in directory:
+        api_item['path'] = ':source'
+        api_item['summary'] = 'Synthetic log endpoint.'
+        api_item['request'] = {'http_method': 'GET', 'parameters': synthesize_api_parameters(rng)}
+    return {'directory': directory}
+
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        f.write(json.dumps(data, indent=2))
+
+
+def run_stage_process(args, workdir, log, check=True):
+    # wait4 reports the peak RSS of this process tree alone, resource.RUSAGE_CHILDREN would not
+    log.flush()
+    process = subprocess.Popen(args, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    dummy, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status >> 8
+    if check and process.returncode != 0:
+        raise Exception('%s failed with status %d, see %s' % (' '.join(args), process.returncode, log.name))
+    return usage.ru_maxrss, process.returncode
+
+
+def prepare_workdir(workdir):
+    for source in PIPELINE_SOURCES:
+        source_path = os.path.join(REPO_ROOT, source)
+        if os.path.isdir(source_path):
+            shutil.copytree(source_path, os.path.join(workdir, source), symlinks=True)
+        else:
+            shutil.copy(source_path, workdir)
+    os.makedirs(os.path.join(workdir, 'schemas'))
+    os.makedirs(os.path.join(workdir, 'monitor_schemas'))
+    # generate_doc.py imports the modules, which import the collection from galaxy_output
+    collection_path = os.path.join(workdir, 'galaxy_output', 'ansible_collections', 'fortinet', 'fortios')
+    os.makedirs(collection_path)
+    os.symlink(os.path.join(workdir, 'galaxy_templates', 'collection', 'plugins'), os.path.join(collection_path, 'plugins'))
+
+
+def stage_synthesize(args, workdir, log):
+    schema_files = list()
+    for schema in synthesize_cmdb_schemas(args.tables, args.attributes, args.versions, args.seed):
+        schema_files.append(os.path.join('schemas', schema['version'] + '.json'))
+        write_json(os.path.join(workdir, schema_files[-1]), schema)
+    monitor_schema_files = list()
+    for schema in synthesize_monitor_schemas(args.monitor_endpoints, args.versions, args.seed):
+        monitor_schema_files.append(os.path.join('monitor_schemas', schema['version'] + '.json'))
+        write_json(os.path.join(workdir, monitor_schema_files[-1]), schema)
+    write_json(os.path.join(workdir, 'log_schema.json'), synthesize_log_schema(args.log_endpoints, args.seed))
+    args.schema_files = schema_files
+    args.monitor_schema_files = monitor_schema_files
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def stage_merge(args, workdir, log):
+    peak_rss, dummy = run_stage_process([args.python3, 'scripts/merge_schema.py', '--jobs', str(args.jobs)] + args.schema_files, workdir, log)
+    monitor_peak_rss, dummy = run_stage_process([args.python3, 'scripts/merge_monitor_schema.py'] + args.monitor_schema_files, workdir, log)
+    return max(peak_rss, monitor_peak_rss)
+
+
+def stage_render(args, workdir, log):
+    render_args = [args.python2, 'scripts/generate_modules.py', '--jobs', str(args.jobs)]
+    if args.compact_schema:
+        render_args.append('--compact-schema')
+    peak_rss, dummy = run_stage_process(render_args, workdir, log)
+    return peak_rss
+
+
+def stage_doc(args, workdir, log):
+    peak_rss = 0
+    failures = list()
+    output_folder = os.path.join(workdir, 'output')
+    for dirpath, dirnames, filenames in sorted(os.walk(output_folder)):
+        for filename in sorted(filenames):
+            if not filename.startswith('fortios_') or not filename.endswith('.py'):
+                continue
+            src = os.path.relpath(os.path.join(dirpath, filename), workdir)
+            # like scripts/generate_doc, a module the document generator rejects does not stop the others
+            process_peak_rss, returncode = run_stage_process([args.python3, 'scripts/generate_doc.py', src, src[:-3] + '.rst'],
+                                                             workdir, log, check=False)
+            peak_rss = max(peak_rss, process_peak_rss)
+            if returncode != 0:
+                failures.append(filename)
+    if failures:
+        print('generate_doc.py failed on %d module(s): %s' % (len(failures), ', '.join(failures)))
+    return peak_rss
+
+
+STAGE_RUNNERS = {
+    'synthesize': stage_synthesize,
+    'merge': stage_merge,
+    'render': stage_render,
+    'doc': stage_doc,
+}
+
+
+def scenario_key(args):
+    return 'tables=%d,attributes=%d,versions=%d,monitor=%d,log=%d,jobs=%d,compact=%s,seed=%d' % (
+        args.tables, args.attributes, args.versions, args.monitor_endpoints, args.log_endpoints,
+        args.jobs, args.compact_schema, args.seed)
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return dict()
+    with open(path, 'r') as f:
+        return json.loads(f.read())
+
+
+def save_baselines(path, baselines):
+    with open(path, 'w') as f:
+        f.write(json.dumps(baselines, indent=2, sort_keys=True))
+
+
+def format_change(value, baseline_value):
+    if not baseline_value:
+        return ''
+    return '%+.1f%%' % ((value - baseline_value) * 100.0 / baseline_value)
+
+
+def report(result, baseline, tolerance):
+    regressions = list()
+    print('%-12s %10s %8s %12s %8s' % ('stage', 'time (s)', 'change', 'peak rss (MB)', 'change'))
+    for stage in result['stages']:
+        measures = result['stages'][stage]
+        baseline_measures = baseline['stages'].get(stage, dict()) if baseline else dict()
+        print('%-12s %10.3f %8s %12.1f %8s' % (stage,
+                                               measures['seconds'],
+                                               format_change(measures['seconds'], baseline_measures.get('seconds')),
+                                               measures['peak_rss_kb'] / 1024.0,
+                                               format_change(measures['peak_rss_kb'], baseline_measures.get('peak_rss_kb'))))
+        for measure in ['seconds', 'peak_rss_kb']:
+            if baseline_measures.get(measure) and measures[measure] > baseline_measures[measure] * (1 + tolerance):
+                regressions.append('%s %s' % (stage, measure))
+    print('%-12s %10.3f %8s' % ('total', result['seconds'], format_change(result['seconds'], baseline['seconds'] if baseline else None)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the generation pipeline with synthetic schemas')
+    parser.add_argument('--tables', type=int, default=200, help='number of CMDB tables (default: 200)')
+    parser.add_argument('--attributes', type=int, default=20, help='number of attributes per table (default: 20)')
+    parser.add_argument('--versions', type=int, default=5, help='number of FortiOS versions (default: 5)')
+    parser.add_argument('--monitor-endpoints', type=int, default=100, help='number of monitor endpoints (default: 100)')
+    parser.add_argument('--log-endpoints', type=int, default=10, help='number of log endpoints (default: 10)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of merging and rendering processes (default: 1)')
+    parser.add_argument('--compact-schema', action='store_true', help='render the modules with --compact-schema')
+    parser.add_argument('--until', default=STAGES[-1], choices=STAGES,
+                        help='last stage to run, each stage needs the output of the previous ones (default: %(default)s)')
+    parser.add_argument('--python2', default='python2', help='interpreter of generate_modules.py (default: python2)')
+    parser.add_argument('--python3', default=sys.executable, help='interpreter of the python3 scripts (default: this one)')
+    parser.add_argument('--workdir', default=None, help='scratch directory, kept after the run (default: a temporary one)')
+    parser.add_argument('--baseline', default=os.path.join(REPO_ROOT, 'benchmark_baselines.json'),
+                        help='file of the saved baselines, one per scenario, the measures are only comparable on the machine '
+                             'that saved them and the default file is ignored by git (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline of its scenario')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative slowdown or growth over the baseline reported as a regression (default: 0.25)')
+    args = parser.parse_args()
+
+    if args.workdir and os.path.exists(args.workdir):
+        parser.error('the scratch directory already exists: %s' % (args.workdir))
+    workdir = args.workdir or tempfile.mkdtemp(prefix='fortios-benchmark-')
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    prepare_workdir(workdir)
+
+    result = {'seconds': 0, 'stages': dict()}
+    try:
+        with open(os.path.join(workdir, 'benchmark.log'), 'w') as log:
+            start = time.time()
+            for stage in STAGES[:STAGES.index(args.until) + 1]:
+                stage_start = time.time()
+                peak_rss = STAGE_RUNNERS[stage](args, workdir, log)
+                result['stages'][stage] = {'seconds': round(time.time() - stage_start, 3), 'peak_rss_kb': peak_rss}
+            result['seconds'] = round(time.time() - start, 3)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    key = '%s,until=%s' % (scenario_key(args), args.until)
+    baselines = load_baselines(args.baseline)
+    print('scenario: %s' % (key))
+    regressions = report(result, baselines.get(key), args.tolerance)
+    if args.save_baseline:
+        baselines[key] = result
+        save_baselines(args.baseline, baselines)
+        print('baseline saved in %s' % (args.baseline))
+    elif regressions:
+        print('regressions over the baseline: %s' % (', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#! /usr/bin/python3
+"""
+Benchmark merge_schema.py against synthetic FortiOS schemas.
+
+Every synthetic version carries the same tables, each enum attribute drops a
+few of the options of the previous version and introduces new ones, which is
+the worst case for option matching:
+
+    ./scripts/benchmark_merge_schema.py --versions 17 --tables 10 --attributes 5 --options 5000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from merge_schema import merge_schemas
+
+
+def synthesize_schema(version_index, tables, attributes, options, rng):
+    results = list()
+    for table_index in range(tables):
+        children = dict()
+        for attribute_index in range(attributes):
+            attribute_name = 'attr-%d' % (attribute_index)
+            first_option = version_index * (options // 20)
+            children[attribute_name] = {
+                'name': attribute_name,
+                'category': 'unitary',
+                'type': 'option',
+                'help': 'Synthetic enum attribute.',
+                'options': [{'name': 'option-%d' % (option_index), 'help': 'Synthetic option.'}
+                            for option_index in range(first_option, first_option + options)
+                            if rng.random() > 0.05],
+            }
+        table_name = 'table-%d' % (table_index)
+        results.append({
+            'path': 'benchmark',
+            'name': table_name,
+            'schema': {
+                'name': table_name,
+                'category': 'table',
+                'help': 'Synthetic table.',
+                'mkey': 'attr-0',
+                'mkey_type': 'string',
+                'children': children,
+            },
+        })
+    return {
+        'version': '%d.%d.%d' % (6 + version_index // 9, version_index % 9 // 3 * 2, version_index % 3),
+        'build': 1000 + version_index,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark merge_schema.py with synthetic schemas')
+    parser.add_argument('--versions', type=int, default=17)
+    parser.add_argument('--tables', type=int, default=10)
+    parser.add_argument('--attributes', type=int, default=5)
+    parser.add_argument('--options', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of merging processes, 0 for one per cpu (default: 1)')
+    args = parser.parse_args()
+
+    jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+    rng = random.Random(args.seed)
+    schemas = [synthesize_schema(version_index, args.tables, args.attributes, args.options, rng)
+               for version_index in range(args.versions)]
+    total_options = sum(len(attribute['options'])
+                        for schema in schemas
+                        for table in schema['results']
+                        for attribute in table['schema']['children'].values())
+
+    start = time.time()
+    super_schema = merge_schemas(schemas, jobs)
+    elapsed = time.time() - start
+
+    merged_options = sum(len(attribute['options'])
+                         for table in super_schema['results']
+                         for attribute in table['schema']['children'].values())
+    print('versions: %d, tables: %d, jobs: %d, options in input: %d, options merged: %d' %
+          (args.versions, args.tables, jobs, total_options, merged_options))
+    print('merge time: %.3fs (%.2fus per input option)' % (elapsed, elapsed * 1000000 / max(total_options, 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#! /usr/bin/python3
+"""
+Benchmark the runtime hot paths of the generated modules and of module_utils.
+
+The benchmark imports generated modules, by default fortios_firewall_policy and
+fortios_system_interface of the last generator run, and fills every attribute
+of their schema, each table attribute with --members members. A FortiOSHandler
+talks to a local stand-in FortiOS HTTP server which serves the system status and
+the object itself, so the check mode path is measured with real HTTP round trips:
+
+    ./scripts/generate_modules.py
+    ./scripts/benchmark_module_utils.py --members 50
+    ./scripts/benchmark_module_utils.py --module output/v6.0.0/router/fortios_router_bgp.py
+
+Every function is called --iterations times with the garbage collector disabled,
+its arguments are prepared outside of the timed section. The allocations are
+measured on one more call: the peak of tracemalloc and the number of memory
+blocks the call left allocated.
+"""
+import argparse
+import atexit
+import copy
+import gc
+import glob
+import importlib.util
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from http import client as http_client
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib import parse as urlencoding
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ['firewall/fortios_firewall_policy.py', 'system/fortios_system_interface.py']
+
+SYSTEM_STATUS_URL = '/api/v2/monitor/system/status'
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, system_version):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInRequestHandler)
+        self.system_version = system_version
+        # the one object of the stand-in device, whichever table it is asked from
+        self.mkey = None
+        self.object = None
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are two writes, do not let them wait for a delayed ack
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        response = {'http_method': 'GET', 'vdom': 'root', 'version': self.server.system_version, 'build': 1000}
+        if path == SYSTEM_STATUS_URL:
+            response.update({'http_status': 200, 'status': 'success', 'results': {}})
+        elif path.startswith('/api/v2/cmdb/') and self.server.mkey is not None and \
+                path.endswith('/' + urlencoding.quote(str(self.server.mkey), safe='')):
+            response.update({'http_status': 200, 'status': 'success', 'results': [self.server.object]})
+        else:
+            response.update({'http_status': 404, 'status': 'error'})
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(response['http_status'])
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInConnection(object):
+    """
+    The methods of the httpapi plugin FortiOSHandler calls, over a kept alive
+    connection to the stand-in server instead of the ansible-connection socket.
+    """
+
+    def __init__(self, port):
+        self._http = http_client.HTTPConnection('127.0.0.1', port)
+        status, result = self.send_request(url=SYSTEM_STATUS_URL)
+        self._system_version = json.loads(result)['version']
+
+    def send_request(self, url, params=None, data=None, method='GET', **kwargs):
+        self._http.request(method, url, body=data)
+        response = self._http.getresponse()
+        return response.status, response.read().decode('utf-8')
+
+    def get_system_version(self):
+        return self._system_version
+
+    def mkey_cache_enabled(self):
+        return False
+
+    def check_mode_cache_enabled(self):
+        return False
+
+
+class BenchmarkModule(object):
+    # the attributes of AnsibleModule FortiOSHandler and check_schema_versioning read
+
+    def __init__(self, params):
+        self.params = params
+
+    def warn(self, msg):
+        pass
+
+
+def install_collection():
+    # the modules import the plugins of the collection, which are linked from a scratch directory
+    # instead of the galaxy_output folder of the repository
+    collections_root = tempfile.mkdtemp(prefix='fortios-benchmark-')
+    atexit.register(shutil.rmtree, collections_root, True)
+    collection_path = os.path.join(collections_root, 'ansible_collections', 'fortinet', 'fortios')
+    os.makedirs(collection_path)
+    os.symlink(os.path.join(REPO_ROOT, 'galaxy_templates', 'collection', 'plugins'), os.path.join(collection_path, 'plugins'))
+    sys.path.append(collections_root)
+
+
+def load_generated_module(path):
+    if not any(os.path.exists(os.path.join(folder, 'ansible_collections', 'fortinet', 'fortios', 'plugins')) for folder in sys.path):
+        install_collection()
+    module_name = os.path.basename(path)[:-3]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def synthesize_value(name, spec, members, index=0):
+    if 'options' in spec and spec.get('type') == 'list':
+        return [synthesize_params(spec['options'], members, member_index) for member_index in range(members)]
+    if 'options' in spec:
+        return synthesize_params(spec['options'], members, index)
+    if spec.get('type') == 'list':
+        choices = spec.get('choices') or ['%s-%d' % (name, choice_index) for choice_index in range(members)]
+        return choices[:members]
+    if spec.get('choices'):
+        return spec['choices'][index % len(spec['choices'])]
+    if spec.get('type') == 'int':
+        return index + 1
+    return '%s-%d' % (name, index)
+
+
+def synthesize_params(options, members, index=0):
+    return dict((name, synthesize_value(name, options[name], members, index)) for name in options)
+
+
+def measure(func, prepare, iterations):
+    timings = list()
+    gc.disable()
+    try:
+        for dummy in range(iterations):
+            args = prepare()
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+        args = prepare()
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # the blocks of the result are the ones the call keeps alive
+        blocks = sys.getallocatedblocks() - blocks
+        del result
+    finally:
+        gc.enable()
+    timings.sort()
+    return {
+        'min_us': round(timings[0] * 1000000, 2),
+        'median_us': round(timings[len(timings) // 2] * 1000000, 2),
+        'peak_kb': round(peak / 1024.0, 1),
+        'blocks': blocks,
+    }
+
+
+def benchmark_module(path, members, iterations, system_version):
+    mod = load_generated_module(path)
+    from ansible_collections.fortinet.fortios.plugins.module_utils.fortios.fortios import FortiOSHandler
+    from ansible_collections.fortinet.fortios.plugins.module_utils.fortios.fortios import check_schema_versioning
+    from ansible_collections.fortinet.fortios.plugins.module_utils.fortios.fortios import schema_to_module_spec
+    from ansible_collections.fortinet.fortios.plugins.module_utils.fortios.comparison import is_same_comparison
+    from ansible_collections.fortinet.fortios.plugins.module_utils.fortios.comparison import serialize
+
+    top_level_name = mod.__name__[len('fortios_'):]
+    with open(path, 'r') as f:
+        # the mkey is a local of main() in the generated modules
+        mkeyname_match = re.search(r"mkeyname = '([^']+)'", f.read())
+    versioned_schema = mod.versioned_schema
+    module_spec = mod.module_spec if hasattr(mod, 'module_spec') else schema_to_module_spec(versioned_schema)
+    params = synthesize_params(module_spec['options'], members)
+    filter_data = getattr(mod, 'filter_%s_data' % (top_level_name))
+    flatten = getattr(mod, 'flatten_multilists_attributes', lambda data: data)
+    desired = mod.underscore_to_hyphen(filter_data(flatten(copy.deepcopy(params))))
+
+    versions = versioned_schema.get('revision_versions') or sorted(versioned_schema['revisions'])
+    server = StandInServer(system_version or versions[0])
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    try:
+        mkeyname = mkeyname_match.group(1) if mkeyname_match else None
+        fos = FortiOSHandler(StandInConnection(server.server_address[1]), None, mkeyname)
+        current = copy.deepcopy(desired)
+        data = {'vdom': 'root', 'state': 'present', top_level_name: params}
+        fos._module = BenchmarkModule(data)
+        serialized_desired = serialize(desired)
+        serialized_current = serialize(current)
+
+        benchmarks = [
+            ('schema_to_module_spec', schema_to_module_spec, lambda: (versioned_schema,)),
+            ('check_schema_versioning', check_schema_versioning, lambda: (fos, versioned_schema, top_level_name)),
+            ('flatten_multilists_attributes', flatten, lambda: (copy.deepcopy(params),)),
+            ('underscore_to_hyphen', mod.underscore_to_hyphen, lambda: (filter_data(flatten(copy.deepcopy(params))),)),
+            ('serialize', serialize, lambda: (current,)),
+            ('is_same_comparison', is_same_comparison, lambda: (serialized_current, serialized_desired)),
+        ]
+        check_mode_function = getattr(mod, top_level_name)
+        if 'check_mode' in check_mode_function.__code__.co_varnames:
+            server.mkey = desired.get(mkeyname) if mkeyname else None
+            server.object = current
+            benchmarks.append(('check mode (HTTP)', check_mode_function, lambda: (copy.deepcopy(data), fos, True)))
+
+        results = dict()
+        for benchmark_name, func, prepare in benchmarks:
+            results[benchmark_name] = measure(func, prepare, iterations)
+        return results
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def find_default_modules():
+    modules = list()
+    for module in DEFAULT_MODULES:
+        modules.extend(sorted(glob.glob(os.path.join(REPO_ROOT, 'output', '*', module)))[-1:])
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the runtime hot paths of generated FortiOS modules')
+    parser.add_argument('--module', action='append', default=None, metavar='PATH',
+                        help='generated module to benchmark, can be repeated (default: %s of output/)' % (', '.join(DEFAULT_MODULES)))
+    parser.add_argument('--members', type=int, default=20, help='number of members of every table attribute (default: 20)')
+    parser.add_argument('--iterations', type=int, default=200, help='number of timed calls per function (default: 200)')
+    parser.add_argument('--system-version', default=None,
+                        help='version the stand-in device reports (default: the oldest version of the module)')
+    parser.add_argument('--json', default=None, metavar='FILE', help='also write the results to this file')
+    args = parser.parse_args()
+
+    modules = args.module or find_default_modules()
+    if not modules:
+        parser.error('no generated module found in output/, run the generator or give --module')
+
+    all_results = dict()
+    for module in modules:
+        results = benchmark_module(module, args.members, args.iterations, args.system_version)
+        all_results[os.path.basename(module)] = results
+        print('%s (members: %d, iterations: %d)' % (os.path.basename(module), args.members, args.iterations))
+        print('    %-32s %12s %12s %10s %8s' % ('function', 'min (us)', 'median (us)', 'peak (KB)', 'blocks'))
+        for benchmark_name in results:
+            measures = results[benchmark_name]
+            print('    %-32s %12.2f %12.2f %10.1f %8d' % (benchmark_name, measures['min_us'], measures['median_us'],
+                                                          measures['peak_kb'], measures['blocks']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps(all_results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
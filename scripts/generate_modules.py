@@ -1,10 +1,25 @@
 #!/usr/bin/python
-from jinja2 import Template, Environment, FileSystemLoader
+import argparse
+import base64
+import hashlib
+import collections
 import json
 import autopep8
+import multiprocessing
 import os
 import re
 import sys
+import traceback
+import zlib
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import generate_modules_utility
+from generate_modules_utility import get_template, get_template_registry, init_template_registry
+from generate_modules_utility import StreamingSchemaReader, load_monitor_schema
 
 def replaceSpecialChars(str):
     return str.replace('-', '_').replace('.', '_').replace('+', 'plus')
@@ -181,7 +196,117 @@ def fix_multiple_values_attribute(schema, special_attributes):
     trace = list()
     fix_multiple_values_attribute_internal(schema, special_attributes, trace)
 
-def renderModule(schema, version, defined_special_attributes, valid_identifiers, version_added, supports_check_mode, movable=False):
+def version_sort_key(version):
+    return tuple(int(number) for number in version.lstrip('v').split('.'))
+
+
+def collect_revision_versions(schema, versions):
+    if 'revisions' in schema:
+        versions.update(schema['revisions'].keys())
+    for option in schema.get('options', []):
+        collect_revision_versions(option, versions)
+    for child in schema.get('children', {}).values():
+        collect_revision_versions(child, versions)
+
+
+def attach_revision_masks(schema, version_bits):
+    if 'revisions' in schema:
+        present = 0
+        supported = 0
+        for ver, state in schema['revisions'].items():
+            present |= version_bits[ver]
+            if state:
+                supported |= version_bits[ver]
+        schema['revision_present'] = present
+        schema['revision_supported'] = supported
+    for option in schema.get('options', []):
+        attach_revision_masks(option, version_bits)
+    for child in schema.get('children', {}).values():
+        attach_revision_masks(child, version_bits)
+
+
+def supported_positions(present, supported, version_count):
+    # bit p is set if the node is supported by a system whose version is preceded by p of the sorted versions
+    positions = 0
+    for position in range(version_count + 1):
+        preceding = present & ((1 << position) - 1)
+        if preceding and supported >> (preceding.bit_length() - 1) & 1:
+            positions |= 1 << position
+    return positions
+
+
+def attach_validation_plan(schema, version_count):
+    positions = (1 << (version_count + 1)) - 1
+    if 'revisions' in schema:
+        positions = supported_positions(schema['revision_present'], schema['revision_supported'], version_count)
+    for option in schema.get('options', []):
+        positions &= attach_validation_plan(option, version_count)
+    for child in schema.get('children', {}).values():
+        positions &= attach_validation_plan(child, version_count)
+    if 'options' in schema:
+        schema['option_revisions'] = dict((str(option['value']), [option['revision_present'], option['revision_supported']])
+                                          for option in schema['options'])
+    if 'revisions' in schema:
+        schema['revision_subtree'] = positions
+    return positions
+
+
+def compact_revisions(versioned_schema):
+    # the revisions of every node as bitmaps over the sorted versions of the module,
+    # the version check at runtime then needs no sorting.
+    versions = set()
+    collect_revision_versions(versioned_schema, versions)
+    sorted_versions = sorted(versions, key=version_sort_key)
+    version_bits = dict((ver, 1 << i) for i, ver in enumerate(sorted_versions))
+    attach_revision_masks(versioned_schema, version_bits)
+    attach_validation_plan(versioned_schema, len(sorted_versions))
+    versioned_schema['revision_versions'] = sorted_versions
+    return versioned_schema
+
+
+def generate_module_spec(schema):
+    # mirrors schema_to_module_spec() of module_utils, so that the generated
+    # modules carry their argument spec instead of deriving it on every task.
+    rdata = dict()
+    if 'type' not in schema:
+        raise AssertionError('Invalid Schema')
+    if schema['type'] == 'dict' or (schema['type'] == 'list' and 'children' in schema):
+        rdata['type'] = schema['type']
+        rdata['required'] = False
+        rdata['options'] = dict()
+        for child in schema['children']:
+            rdata['options'][child] = generate_module_spec(schema['children'][child])
+    elif schema['type'] in ['integer', 'string', 'list']:
+        rdata['type'] = {'integer': 'int', 'string': 'str', 'list': 'list'}[schema['type']]
+        rdata['required'] = False
+        if 'options' in schema:
+            # the choices are dropped if the semantic meaning of the options changes across versions
+            param_semantic_changed = False
+            for ver in schema['revisions']:
+                if any(ver not in option['revisions'] for option in schema['options']):
+                    param_semantic_changed = True
+                    break
+            if not param_semantic_changed:
+                rdata['choices'] = [option['value'] for option in schema['options']]
+    else:
+        raise AssertionError()
+    return rdata
+
+
+def schema_literal(data):
+    return json.dumps(data, indent=4).replace('": false', '": False').replace('": true', '": True')
+
+
+def compact_schema_literal(data):
+    # zlib compressed json in base64, a string literal is shipped and compiled far
+    # faster than the dict literal, lines are kept short for splitLargeLines.
+    encoded = base64.b64encode(zlib.compress(json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8'), 9)).decode('ascii')
+    chunks = [encoded[i:i + 120] for i in range(0, len(encoded), 120)]
+    return "load_compact_schema(\n    '" + "'\n    '".join(chunks) + "')"
+
+
+def renderModule(schema, version, defined_special_attributes, valid_identifiers, version_added, supports_check_mode, movable=False,
+                 compact_schema=False):
 
     # Generate module
     versioned_schema = generate_versioned_fields(schema['schema'])
@@ -189,10 +314,10 @@ def renderModule(schema, version, defined_special_attributes, valid_identifiers,
     special_attributes = extract_multiple_values_attribute(versioned_schema)
     merge_multiple_values_attributes(special_attributes, defined_special_attributes)
     fix_multiple_values_attribute(versioned_schema, special_attributes)
-    versioned_schema = json.dumps(versioned_schema, indent=4).replace('": false', '": False').replace('": true', '": True')
-    file_loader = FileSystemLoader('ansible_templates')
-    env = Environment(loader=file_loader,
-                      lstrip_blocks=False, trim_blocks=False)
+    versioned_schema = compact_revisions(versioned_schema)
+    render_schema = compact_schema_literal if compact_schema else schema_literal
+    module_spec = render_schema(generate_module_spec(versioned_schema))
+    versioned_schema = render_schema(versioned_schema)
     if 'children' not in schema['schema']:
         print('warning: not a valid schema, skip.')
         return
@@ -218,16 +343,18 @@ def renderModule(schema, version, defined_special_attributes, valid_identifiers,
 
     special_attributes_flattened = [','.join(x for x in elem) for elem in special_attributes]
 
-    template = env.get_template('doc.j2')
+    template = get_template('doc.j2')
     output = template.render(calculateFullPath=calculateFullPath, **locals())
 
-    template = env.get_template('examples.j2')
-    output += template.render(**locals())
+    # the examples are embedded in the module and also written as a standalone playbook
+    template = get_template('examples.j2')
+    examples_output = template.render(**locals())
+    output += examples_output
 
-    template = env.get_template('return.j2')
+    template = get_template('return.j2')
     output += template.render(**locals())
 
-    template = env.get_template('code.j2')
+    template = get_template('code.j2')
     output += template.render(calculateFullPath=calculateFullPath, vi=valid_identifiers_module, **locals())
 
     dir = 'output/' + version + '/' + path
@@ -243,16 +370,14 @@ def renderModule(schema, version, defined_special_attributes, valid_identifiers,
     # Generate example
     file_example = open('output/' + version + '/' + path + '/fortios_' + path +
                         '_' + name + '_example.yml', 'w')
-    template = env.get_template('examples.j2')
-    output = template.render(**locals())
-    lines = output.splitlines(True)
+    lines = examples_output.splitlines(True)
     file_example.writelines(lines[2:-1])
     file_example.close()
 
     # Generate test
     file_example = open('output/' + version + '/' + path + '/test_fortios_' + path +
                         '_' + name + '.py', 'w')
-    template = env.get_template('tests.j2')
+    template = get_template('tests.j2')
     output = template.render(**locals())
     lines = output.splitlines(True)
     file_example.writelines(lines)
@@ -271,11 +396,7 @@ def convert_mkey_type(mkey_type):
 
 def renderFactModule(schema_results, version):
     # Generate module
-    file_loader = FileSystemLoader('ansible_templates')
-    env = Environment(loader=file_loader,
-                      lstrip_blocks=False, trim_blocks=False)
-
-    template = env.get_template('fact.j2')
+    template = get_template('fact.j2')
 
     selector_definitions = {
             schema_result['path'] + "_" + schema_result['name']: {
@@ -360,11 +481,252 @@ def generate_versioned_fields(schema):
     return rdata
 
 
-def jinjaExecutor(number=None):
-
-    fgt_schema_file = open('fgt_schema.json').read()
-    fgt_schema = json.loads(fgt_schema_file)
-    fgt_sch_results = fgt_schema['results']
+def isRenderableSchema(pn):
+    return 'diagnose_' not in pn['path'] and 'execute_' not in pn['path'] and 'test' != pn['path'] and '' != pn['path']
+
+
+# generators in generate_modules_utility which only depend on the monitor/log schemas
+UTILITY_GENERATORS = ['generate_monitor_fact',
+                      'generate_monitor_modules',
+                      'generate_monitor_rst',
+                      'generate_log_fact']
+
+_worker_context = None
+
+
+def _init_render_worker(context):
+    global _worker_context
+    _worker_context = context
+
+
+def _capture_output(func, *args):
+    # run func with stdout captured so that the parent can print it in a deterministic order.
+    captured = StringIO()
+    saved_stdout = sys.stdout
+    sys.stdout = captured
+    error = None
+    result = None
+    try:
+        result = func(*args)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        sys.stdout = saved_stdout
+    return result, captured.getvalue(), error
+
+
+def _render_module_task(task):
+    index, pn = task
+    ctx = _worker_context
+    module_name = getModuleName(pn['path'], pn['name'])
+    registry = get_template_registry()
+    hits, misses = registry.hits, registry.misses
+    dummy, output, error = _capture_output(renderModule,
+                                           pn,
+                                           ctx['version'],
+                                           ctx['special_attributes'][module_name] if module_name in ctx['special_attributes'] else [],
+                                           ctx['valid_identifiers'],
+                                           ctx['version_added'],
+                                           module_name in ctx['check_mode_support'],
+                                           module_name in ctx['movable_modules'],
+                                           ctx['compact_schema'])
+    template_counters = (registry.hits - hits, registry.misses - misses)
+    # renderModule normalizes the schema in place, the fact generators in the parent read the normalized mkey.
+    return index, module_name, output, error, pn['schema'].get('mkey', None), template_counters
+
+
+def _run_utility_generator(generator_name, version):
+    import generate_modules_utility
+    getattr(generate_modules_utility, generator_name)(version)
+
+
+def _utility_generator_task(generator_name, version):
+    registry = get_template_registry()
+    hits, misses = registry.hits, registry.misses
+    dummy, output, error = _capture_output(_run_utility_generator, generator_name, version)
+    return generator_name, output, error, (registry.hits - hits, registry.misses - misses)
+
+
+def renderModulesParallel(tasks, schema_summaries, version, special_attributes, valid_identifiers,
+                          version_added_json, check_mode_support_set, movable_modules, jobs, compact_schema=False):
+    context = {
+        'version': version,
+        'special_attributes': special_attributes,
+        'valid_identifiers': valid_identifiers,
+        'version_added': version_added_json,
+        'check_mode_support': check_mode_support_set,
+        'movable_modules': movable_modules,
+        'compact_schema': compact_schema,
+    }
+    errors = list()
+    rendered_indexes = list()
+    output_folder = 'output/' + version
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    # parse the monitor schema before forking, the monitor generators share it.
+    load_monitor_schema()
+    pool = multiprocessing.Pool(processes=jobs, initializer=_init_render_worker, initargs=(context,))
+    try:
+        # monitor and log generators are independent of the cmdb schema, keep them busy in the background.
+        utility_tasks = [pool.apply_async(_utility_generator_task, (generator_name, version))
+                         for generator_name in UTILITY_GENERATORS]
+
+        # only a bounded number of tables are in flight, results are consumed in schema order.
+        window = jobs * 4
+        pending = collections.deque()
+        tasks_exhausted = False
+        real_counter = 0
+        while True:
+            while not tasks_exhausted and len(pending) < window:
+                task = next(tasks, None)
+                if task is None:
+                    tasks_exhausted = True
+                else:
+                    pending.append(pool.apply_async(_render_module_task, (task,)))
+            if not len(pending):
+                break
+            index, module_name, output, error, mkey, template_counters = pending.popleft().get()
+            get_template_registry().add_counters(*template_counters)
+            print('\n\033[0mParsing schema:')
+            print('\033[0mModule name: \033[92m' + module_name)
+            print('\033[0mIteration:\033[93m' + str(real_counter) + "\033[0m, Schema position: \033[93m" + str(index))
+            sys.stdout.write(output)
+            if error:
+                errors.append((module_name, error))
+            else:
+                rendered_indexes.append(index)
+                if mkey is not None:
+                    schema_summaries[index]['schema']['mkey'] = mkey
+            real_counter += 1
+
+        config_fact_output = renderFactModule(schema_summaries, version)
+
+        from generate_modules_utility import generate_cofiguration_fact_rst
+        generate_cofiguration_fact_rst(schema_summaries, version)
+
+        for task in utility_tasks:
+            generator_name, output, error, template_counters = task.get()
+            get_template_registry().add_counters(*template_counters)
+            sys.stdout.write(output)
+            if error:
+                errors.append((generator_name, error))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if len(errors):
+        print('\n\033[91m%d error(s) in parallel rendering:\033[0m' % (len(errors)))
+        for task_name, error in errors:
+            print('\033[91m%s\033[0m\n%s' % (task_name, error))
+    return config_fact_output, rendered_indexes, errors
+
+
+# templates and sources whose content affects every module rendered by renderModule
+MODULE_TEMPLATES = ['doc.j2', 'examples.j2', 'return.j2', 'code.j2', 'tests.j2']
+
+
+def getManifestPath(version):
+    return 'output/' + version + '/.module_manifest.json'
+
+
+def loadManifest(version):
+    manifest_path = getManifestPath(version)
+    if not os.path.exists(manifest_path):
+        return dict()
+    with open(manifest_path, 'r') as f:
+        return json.loads(f.read())
+
+
+def saveManifest(version, manifest):
+    with open(getManifestPath(version), 'w') as f:
+        f.write(json.dumps(manifest, indent=2, sort_keys=True))
+        f.flush()
+
+
+def hashGeneratorSources():
+    sha = hashlib.sha1()
+    sources = ['ansible_templates/' + template_name for template_name in MODULE_TEMPLATES]
+    sources.append(os.path.abspath(__file__).replace('.pyc', '.py'))
+    # the template registry and the schema reader live there
+    sources.append(os.path.abspath(generate_modules_utility.__file__).replace('.pyc', '.py'))
+    for source in sources:
+        with open(source, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def getModuleOutputFiles(version, pn):
+    path = replaceSpecialChars(pn['path']).lower()
+    name = replaceSpecialChars(pn['name']).lower()
+    folder = 'output/' + version + '/' + path
+    return [folder + '/fortios_' + path + '_' + name + '.py',
+            folder + '/fortios_' + path + '_' + name + '_example.yml',
+            folder + '/test_fortios_' + path + '_' + name + '.py']
+
+
+def calculateModuleFingerprint(pn, module_name, special_attributes, valid_identifiers, version_added_json,
+                               supports_check_mode, movable, generator_digest, compact_schema=False):
+    schema_text = json.dumps(pn, sort_keys=True)
+    # identifiers are substituted after hyphens become underscores, keep every one that may be hit.
+    normalized_schema_text = schema_text.replace('-', '_')
+    module_valid_identifiers = dict((k, v) for k, v in valid_identifiers.items() if k in normalized_schema_text)
+    fingerprint_input = {
+        'schema': schema_text,
+        'special_attributes': special_attributes.get(module_name, []),
+        'valid_identifiers': module_valid_identifiers,
+        'version_added': version_added_json.get('fortios_' + module_name),
+        'check_mode': supports_check_mode,
+        'movable': movable,
+        'compact_schema': compact_schema,
+        'generator': generator_digest,
+    }
+    return hashlib.sha1(json.dumps(fingerprint_input, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def normalizeSchemaMkey(pn):
+    # the same mkey renderModule leaves in the schema, the fact generators read it for modules skipped as unchanged.
+    if 'children' in pn['schema'] and 'mkey' in pn['schema']:
+        pn['schema']['mkey'] = hyphenToUnderscore(pn['schema']['mkey'])
+
+
+def removeStaleModules(version, manifest, module_names):
+    removed = list()
+    for module_name in sorted(manifest.keys()):
+        if module_name in module_names:
+            continue
+        for output_file in manifest[module_name]['files']:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            output_folder = os.path.dirname(output_file)
+            if os.path.isdir(output_folder) and not os.listdir(output_folder):
+                os.rmdir(output_folder)
+        del manifest[module_name]
+        removed.append(module_name)
+    return removed
+
+
+def summarizeSchema(pn):
+    # the fact generators only read the selector and its mkey, keep these instead of the whole table.
+    summary = {'path': pn['path'], 'name': pn['name'], 'schema': dict()}
+    for key in ['mkey', 'mkey_type']:
+        if key in pn['schema']:
+            summary['schema'][key] = pn['schema'][key]
+    return summary
+
+
+def jinjaExecutor(number=None, jobs=1, bytecode_cache_dir=None, incremental=False, compact_schema=False):
+
+    # compile the templates before forking so that every rendering process inherits them
+    template_registry = init_template_registry(bytecode_cache_dir)
+    template_registry.precompile()
+
+    # the tables are streamed one at a time, only a small summary of each is kept for the fact generators.
+    fgt_schema = StreamingSchemaReader('fgt_schema.json', 'results')
+    version = fgt_schema.get_header(['version'])['version']
+    schema_summaries = list()
 
     special_attributes_file = open('special_attributes.lst').read()
     special_attributes = json.loads(special_attributes_file)
@@ -379,71 +741,127 @@ def jinjaExecutor(number=None):
     movable_modules_file = open('movable_modules.lst').read()
     movable_modules = json.loads(movable_modules_file)
 
-    autopep_files = './output/' + fgt_schema['version']
+    autopep_files = './output/' + version
+    errors = list()
 
     if not number:
-        real_counter = 0
-        for i, pn in enumerate(fgt_sch_results):
-            if 'diagnose_' not in pn['path'] and 'execute_' not in pn['path'] and 'test' != pn['path'] and '' != pn['path']:
+        generator_digest = hashGeneratorSources()
+        manifest = loadManifest(version) if incremental else dict()
+        module_fingerprints = dict()
+        stats = {'changed': 0, 'unchanged': 0}
+
+        def scheduleModules():
+            for i, pn in enumerate(fgt_schema):
+                if not isRenderableSchema(pn):
+                    schema_summaries.append(summarizeSchema(pn))
+                    continue
+                module_name = getModuleName(pn['path'], pn['name'])
+                fingerprint = calculateModuleFingerprint(pn,
+                                                         module_name,
+                                                         special_attributes,
+                                                         valid_identifiers,
+                                                         version_added_json,
+                                                         module_name in check_mode_support_set,
+                                                         module_name in movable_modules,
+                                                         generator_digest,
+                                                         compact_schema)
+                module_fingerprints[module_name] = fingerprint
+                entry = manifest.get(module_name)
+                if incremental and entry and entry['fingerprint'] == fingerprint and \
+                   all(os.path.exists(output_file) for output_file in entry['files']):
+                    stats['unchanged'] += 1
+                    normalizeSchemaMkey(pn)
+                    schema_summaries.append(summarizeSchema(pn))
+                    continue
+                stats['changed'] += 1
+                schema_summaries.append(summarizeSchema(pn))
+                yield i, pn
+
+        if jobs > 1:
+            config_fact_output, rendered_indexes, errors = renderModulesParallel(scheduleModules(),
+                                                                                 schema_summaries,
+                                                                                 version,
+                                                                                 special_attributes,
+                                                                                 valid_identifiers,
+                                                                                 version_added_json,
+                                                                                 check_mode_support_set,
+                                                                                 movable_modules,
+                                                                                 jobs,
+                                                                                 compact_schema)
+            autopep_files += ' ' + config_fact_output
+        else:
+            rendered_indexes = list()
+            for real_counter, (i, pn) in enumerate(scheduleModules()):
                 module_name = getModuleName(pn['path'], pn['name'])
                 print('\n\033[0mParsing schema:')
                 print('\033[0mModule name: \033[92m' + module_name)
                 print('\033[0mIteration:\033[93m' + str(real_counter) + "\033[0m, Schema position: \033[93m" + str(i))
-                renderModule(fgt_sch_results[i],
-                             fgt_schema['version'],
+                renderModule(pn,
+                             version,
                              special_attributes[module_name] if module_name in special_attributes else [],
                              valid_identifiers,
                              version_added_json,
                              module_name in check_mode_support_set,
-                             module_name in movable_modules)
-                real_counter += 1
+                             module_name in movable_modules,
+                             compact_schema)
+                schema_summaries[i] = summarizeSchema(pn)
+                rendered_indexes.append(i)
+            autopep_files += ' ' + renderFactModule(schema_summaries, version)
+
+        if incremental:
+            removed_modules = removeStaleModules(version, manifest, module_fingerprints)
+            print('\n\033[0mIncremental generation: %d modules changed, %d unchanged, %d removed' %
+                  (stats['changed'], stats['unchanged'], len(removed_modules)))
+            for module_name in removed_modules:
+                print('\033[0mModule removed: \033[91m' + module_name)
+
+        for i in rendered_indexes:
+            module_name = getModuleName(schema_summaries[i]['path'], schema_summaries[i]['name'])
+            manifest[module_name] = {
+                'fingerprint': module_fingerprints[module_name],
+                'files': [output_file for output_file in getModuleOutputFiles(version, schema_summaries[i])
+                          if os.path.exists(output_file)],
+            }
+        saveManifest(version, manifest)
     else:
-        module_name = getModuleName(fgt_sch_results[number]['path'], fgt_sch_results[number]['name'])
-        renderModule(fgt_sch_results[number],
-                     fgt_schema['version'],
-                     special_attributes[module_name] if module_name in special_attributes else [],
-                     valid_identifiers,
-                     version_added_json,
-                     module_name in check_mode_support_set)
+        for i, pn in enumerate(fgt_schema):
+            if i == number:
+                module_name = getModuleName(pn['path'], pn['name'])
+                renderModule(pn,
+                             version,
+                             special_attributes[module_name] if module_name in special_attributes else [],
+                             valid_identifiers,
+                             version_added_json,
+                             module_name in check_mode_support_set,
+                             compact_schema=compact_schema)
+            schema_summaries.append(summarizeSchema(pn))
 
         autopep_files = './output/' + \
-                fgt_schema['version'] + '/' + \
-                replaceSpecialChars(fgt_sch_results[number]['path']) + \
-                '/fortios_' + replaceSpecialChars(fgt_sch_results[number]['path']) + '_' + replaceSpecialChars(fgt_sch_results[number]['name']) + '.py'
+                version + '/' + \
+                replaceSpecialChars(schema_summaries[number]['path']) + \
+                '/fortios_' + replaceSpecialChars(schema_summaries[number]['path']) + '_' + replaceSpecialChars(schema_summaries[number]['name']) + '.py'
 
         autopep_files += ' ./output/' + \
-                fgt_schema['version'] + '/' + \
-                replaceSpecialChars(fgt_sch_results[number]['path']) + \
-                '/test_fortios_' + replaceSpecialChars(fgt_sch_results[number]['path']) + '_' + replaceSpecialChars(fgt_sch_results[number]['name']) + '.py'
+                version + '/' + \
+                replaceSpecialChars(schema_summaries[number]['path']) + \
+                '/test_fortios_' + replaceSpecialChars(schema_summaries[number]['path']) + '_' + replaceSpecialChars(schema_summaries[number]['name']) + '.py'
 
-
-    autopep_files += ' ' + renderFactModule(fgt_sch_results, fgt_schema['version'])
+        autopep_files += ' ' + renderFactModule(schema_summaries, version)
 
     # there is an escape letter in fortios_vpn_ssl_settings.py, replace it.
-    os.popen("sed -i 's/Encode \\\\2F sequence/Encode 2F sequence/g' ./output/" + fgt_schema['version'] + "/vpn_ssl/fortios_vpn_ssl_settings.py")
+    os.popen("sed -i 's/Encode \\\\2F sequence/Encode 2F sequence/g' ./output/" + version + "/vpn_ssl/fortios_vpn_ssl_settings.py")
 
     # copy licence modules
-    licence_output_folder = './output/' + fgt_schema['version'] + '/licence'
+    licence_output_folder = './output/' + version + '/licence'
     os.popen('mkdir -p ' + licence_output_folder)
     os.popen('cp ./galaxy_templates/licence_modules/* ' + licence_output_folder)
 
-    from generate_modules_utility import generate_cofiguration_fact_rst
-    generate_cofiguration_fact_rst(fgt_sch_results, fgt_schema['version'])
-
-    from generate_modules_utility import generate_monitor_fact
-    generate_monitor_fact(fgt_schema['version'])
+    if jobs <= 1 or number:
+        from generate_modules_utility import generate_cofiguration_fact_rst
+        generate_cofiguration_fact_rst(schema_summaries, version)
 
-    from generate_modules_utility import generate_monitor_modules
-    generate_monitor_modules(fgt_schema['version'])
-
-    from generate_modules_utility import generate_monitor_rst
-    generate_monitor_rst(fgt_schema['version'])
-
-    from generate_modules_utility import generate_log_fact
-    generate_log_fact(fgt_schema['version'])
-
-    from generate_modules_utility import generate_log_fact_rst
-    generate_log_fact_rst(fgt_schema['version'])
+        for generator_name in UTILITY_GENERATORS:
+            _run_utility_generator(generator_name, version)
 
     print("\n\n\033[0mExecuting autopep8 ....")
     # Note this is done with popen and not with autopep8.fix_code in order to get the multiprocessig optimization, only available from CLI
@@ -454,17 +872,34 @@ def jinjaExecutor(number=None):
     # Fix exceptional issues due to bugs in autopep
     # Using os.popen for quick edit and modification. Should be replaced by proper Python calls
     print("\n\n\033[0mFinal fixes ....")
-    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_ip_address_type.py")
-    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_network_auth_type.py")
-    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_roaming_consortium.py")
-    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_h2qp_conn_capability.py")
-    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_ip_address_type.py")
-    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_network_auth_type.py")
-    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_roaming_consortium.py")
-    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + fgt_schema['version'] + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_h2qp_conn_capability.py")
+    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_ip_address_type.py")
+    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_network_auth_type.py")
+    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_roaming_consortium.py")
+    os.popen("sed -i 's/filtered_data =/filtered_data = \\\/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_h2qp_conn_capability.py")
+    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_ip_address_type.py")
+    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_network_auth_type.py")
+    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_anqp_roaming_consortium.py")
+    os.popen("sed -i 's/    underscore_to_hyphen/        underscore_to_hyphen/' ./output/" + version + "/wireless_controller_hotspot20/fortios_wireless_controller_hotspot20_h2qp_conn_capability.py")
     os.popen("find . -name 'test_fortios_router_bfd*.py' -exec rm {} \\;")
 
+    print('\033[0m' + template_registry.report())
+    return errors
+
 if __name__ == "__main__":
     print("args " + str(sys.argv))
-    arg = int(sys.argv[1]) if len(sys.argv) > 1 else None
-    jinjaExecutor(arg)
+    parser = argparse.ArgumentParser(description='Generate FortiOS Ansible modules from fgt_schema.json')
+    parser.add_argument('number', type=int, nargs='?', default=None,
+                        help='only render the module at this position of the schema')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of rendering processes, 0 for one per cpu (default: 1)')
+    parser.add_argument('--bytecode-cache', default=None, metavar='DIR',
+                        help='directory to keep the compiled templates across generator runs')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only render the modules whose schema fingerprint changed since the last run')
+    parser.add_argument('--compact-schema', action='store_true',
+                        help='embed the versioned schema and module spec as zlib compressed json instead of dict literals')
+    args = parser.parse_args()
+    jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+    errors = jinjaExecutor(args.number, jobs, args.bytecode_cache, args.incremental, args.compact_schema)
+    if errors:
+        sys.exit(1)
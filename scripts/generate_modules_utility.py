@@ -1,13 +1,213 @@
-from jinja2 import Template, Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 import json
 import os
 
 
+class CountingBytecodeCache(FileSystemBytecodeCache):
+    def __init__(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        super(CountingBytecodeCache, self).__init__(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def load_bytecode(self, bucket):
+        super(CountingBytecodeCache, self).load_bytecode(bucket)
+        if bucket.code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+
+class TemplateRegistry(object):
+    """
+    One jinja environment per generator run, every template is compiled at most once.
+    With a bytecode cache directory, the compiled code is reused across generator runs.
+    """
+
+    def __init__(self, searchpath='ansible_templates', bytecode_cache_dir=None):
+        self.bytecode_cache = CountingBytecodeCache(bytecode_cache_dir) if bytecode_cache_dir else None
+        self.env = Environment(loader=FileSystemLoader(searchpath),
+                               bytecode_cache=self.bytecode_cache,
+                               auto_reload=False,
+                               lstrip_blocks=False, trim_blocks=False)
+        self.templates = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_template(self, name):
+        template = self.templates.get(name)
+        if template is None:
+            self.misses += 1
+            template = self.env.get_template(name)
+            self.templates[name] = template
+        else:
+            self.hits += 1
+        return template
+
+    def precompile(self):
+        for name in self.env.list_templates(extensions=['j2']):
+            self.get_template(name)
+
+    def add_counters(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+
+    def report(self):
+        message = 'template cache: %d hits, %d misses' % (self.hits, self.misses)
+        if self.bytecode_cache:
+            message += ', bytecode cache: %d hits, %d misses' % (self.bytecode_cache.hits, self.bytecode_cache.misses)
+        return message
+
+
+_template_registry = None
+
+
+def init_template_registry(bytecode_cache_dir=None):
+    global _template_registry
+    _template_registry = TemplateRegistry(bytecode_cache_dir=bytecode_cache_dir)
+    return _template_registry
+
+
+def get_template_registry():
+    if _template_registry is None:
+        init_template_registry()
+    return _template_registry
+
+
+def get_template(name):
+    return get_template_registry().get_template(name)
+
+
+class StreamingSchemaReader(object):
+    """
+    Iterate the items of one top level array of a schema file without loading the whole file,
+    e.g. the results of fgt_schema.json or the directory of monitor_schema.json.
+    Only the item being decoded is held in memory.
+    """
+
+    def __init__(self, filepath, array_key, chunk_size=1024 * 1024):
+        self.filepath = filepath
+        self.array_key = array_key
+        self.chunk_size = chunk_size
+        self.header = dict()
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self):
+        for event, key, value in self._events():
+            if event == 'member':
+                self.header[key] = value
+            else:
+                yield value
+
+    def get_header(self, keys=None):
+        """
+        Top level members other than the streamed array, the parsing stops once all the keys are found.
+        """
+        if keys and all(key in self.header for key in keys):
+            return self.header
+        events = self._events()
+        try:
+            for event, key, value in events:
+                if event == 'member':
+                    self.header[key] = value
+                    if keys and all(key in self.header for key in keys):
+                        break
+        finally:
+            events.close()
+        return self.header
+
+    def _events(self):
+        self._file = open(self.filepath, 'r')
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        array_found = False
+        try:
+            self._expect('{')
+            if self._peek() == '}':
+                self._pos += 1
+            else:
+                while True:
+                    key = self._decode()
+                    self._expect(':')
+                    if key == self.array_key:
+                        array_found = True
+                        self._expect('[')
+                        if self._peek() == ']':
+                            self._pos += 1
+                        else:
+                            while True:
+                                yield 'item', None, self._decode()
+                                if self._next_token(',]') == ']':
+                                    break
+                    else:
+                        yield 'member', key, self._decode()
+                    if self._next_token(',}') == '}':
+                        break
+        finally:
+            self._file.close()
+        if not array_found:
+            raise ValueError('%s: no top level %s' % (self.filepath, self.array_key))
+
+    def _fill(self):
+        # read at least as much as already buffered, a large item is re-decoded a logarithmic number of times.
+        chunk = self._file.read(max(self.chunk_size, len(self._buffer) - self._pos))
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        if not chunk:
+            self._eof = True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                raise ValueError('%s: unexpected end of file' % (self.filepath))
+            self._fill()
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError('%s: expecting %s at %s' % (self.filepath, char, self._buffer[self._pos:self._pos + 32]))
+        self._pos += 1
+
+    def _next_token(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError('%s: expecting one of %s at %s' % (self.filepath, chars, self._buffer[self._pos:self._pos + 32]))
+        self._pos += 1
+        return char
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # a number touching the end of the buffer may continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+_monitor_api_items = None
+
+
+def load_monitor_schema():
+    # monitor_schema.json is parsed once and shared by all the monitor generators
+    global _monitor_api_items
+    if _monitor_api_items is None:
+        _monitor_api_items = list(StreamingSchemaReader('monitor_schema.json', 'directory'))
+    return _monitor_api_items
+
+
 def generate_cofiguration_fact_rst(schema_results, version):
-    file_loader = FileSystemLoader('ansible_templates')
-    env = Environment(loader=file_loader,
-                      lstrip_blocks=False, trim_blocks=False)
-    template = env.get_template('configuration_fact.rst.j2')
+    template = get_template('configuration_fact.rst.j2')
 
     selectors = dict()
     for schema_result in schema_results:
@@ -32,11 +232,8 @@ def generate_cofiguration_fact_rst(schema_results, version):
 
 
 def generate_monitor_fact(version):
-    monitor_schema_file = open('monitor_schema.json').read()
-    monitor_schema = json.loads(monitor_schema_file)
     get_api_items = dict()
-    assert('directory' in monitor_schema)
-    for api_item in monitor_schema['directory']:
+    for api_item in load_monitor_schema():
         assert('request' in api_item)
         assert('http_method' in api_item['request'])
         if api_item['request']['http_method'] != 'GET':
@@ -69,19 +266,16 @@ def generate_monitor_fact(version):
                 schemas[selector]['params'][param_name]['description'] = param_desc
                 schemas[selector]['params'][param_name]['required'] = param_required
                 schemas[selector]['description'] = api_item['summary'] if 'summary' in api_item else ''
-    file_loader = FileSystemLoader('ansible_templates')
-    env = Environment(loader=file_loader,
-                      lstrip_blocks=False, trim_blocks=False)
 
     # Render module code
-    template = env.get_template('monitor_fact.j2')
+    template = get_template('monitor_fact.j2')
     data = template.render(selectors=schemas)
     output_path = 'output/' + version + '/fortios_monitor_fact.py'
     with open(output_path, 'w') as f:
         f.write(data)
         f.flush()
     # Render Sphinx doc
-    template = env.get_template('monitor_fact.rst.j2')
+    template = get_template('monitor_fact.rst.j2')
     data = template.render(selectors=schemas)
     output_path = 'output/' + version + '/fortios_monitor_fact.rst'
     with open(output_path, 'w') as f:
@@ -91,16 +285,10 @@ def generate_monitor_fact(version):
 
 def generate_monitor_modules(version):
     # Init template to generate a single module
-    file_loader = FileSystemLoader('ansible_templates')
-    env = Environment(loader=file_loader,
-                      lstrip_blocks=False, trim_blocks=False)
-    template = env.get_template('monitor_config.j2')
+    template = get_template('monitor_config.j2')
 
-    monitor_schema_file = open('monitor_schema.json').read()
-    monitor_schema = json.loads(monitor_schema_file)
     post_api_items = dict()
-    assert('directory' in monitor_schema)
-    for api_item in monitor_schema['directory']:
+    for api_item in load_monitor_schema():
         assert('request' in api_item)
         assert('http_method' in api_item['request'])
         if api_item['request']['http_method'] != 'POST':
@@ -142,14 +330,8 @@ def generate_monitor_modules(version):
 
 
 def generate_monitor_rst(version):
-    file_loader = FileSystemLoader('ansible_templates')
-    env = Environment(loader=file_loader,
-                      lstrip_blocks=False, trim_blocks=False)
-    monitor_schema_file = open('monitor_schema.json').read()
-    monitor_schema = json.loads(monitor_schema_file)
     post_api_items = dict()
-    assert('directory' in monitor_schema)
-    for api_item in monitor_schema['directory']:
+    for api_item in load_monitor_schema():
         assert('request' in api_item)
         assert('http_method' in api_item['request'])
         if api_item['request']['http_method'] != 'POST':
@@ -178,7 +360,7 @@ def generate_monitor_rst(version):
                 schemas[api_item_key]['params'][param_name]['type'] = param_type
                 schemas[api_item_key]['params'][param_name]['required'] = param_required
                 schemas[api_item_key]['params'][param_name]['description'] = param_desc
-    template = env.get_template('monitor.rst.j2')
+    template = get_template('monitor.rst.j2')
     data = template.render(actions=schemas)
     output_path = 'output/' + version + '/fortios_monitor.rst'
     with open(output_path, 'w') as f:
@@ -241,19 +423,16 @@ def generate_log_fact(version):
                 schemas[selector]['params'][param_name]['type'] = param_type
                 schemas[selector]['params'][param_name]['description'] = param_desc
                 schemas[selector]['description'] = api_item['summary'] if 'summary' in api_item else ''
-    file_loader = FileSystemLoader('ansible_templates')
-    env = Environment(loader=file_loader,
-                      lstrip_blocks=False, trim_blocks=False)
 
     # Render module code
-    template = env.get_template('log_fact.j2')
+    template = get_template('log_fact.j2')
     data = template.render(selectors=schemas)
     output_path = 'output/' + version + '/fortios_log_fact.py'
     with open(output_path, 'w') as f:
         f.write(data)
         f.flush()
     # Render Sphinx doc
-    template = env.get_template('log_fact.rst.j2')
+    template = get_template('log_fact.rst.j2')
     data = template.render(selectors=schemas)
     output_path = 'output/' + version + '/fortios_log_fact.rst'
     with open(output_path, 'w') as f:
@@ -1,5 +1,7 @@
 #! /usr/bin/python3
+import argparse
 import json
+import multiprocessing
 import sys
 
 def load_schema(filepath):
@@ -74,36 +76,31 @@ def _merge_api_item(api_item0, api_item1, version):
             if key not in rdata:
                 rdata[key] = list()
             assert(type(rdata[key]) is list)
+            # index the known options by name, the list keeps the order in which options first appeared.
+            option_index = dict()
+            for option in rdata[key]:
+                assert(type(option) is dict)
+                assert('name' in option)
+                option_index.setdefault(option['name'], option)
+            present_options = set()
             for option in value:
                 assert(type(option) is dict)
                 assert('name' in option)
                 option_name = option['name']
-                option_present = False
-                for i in range(len(rdata[key])):
-                    assert('name' in rdata[key][i])
-                    if rdata[key][i]['name'] == option_name:
-                        assert('revisions' in rdata[key][i])
-                        rdata[key][i]['revisions'][version] = True
-                        option_present = True
-                        break
-                if not option_present:
+                present_options.add(option_name)
+                if option_name in option_index:
+                    assert('revisions' in option_index[option_name])
+                    option_index[option_name]['revisions'][version] = True
+                else:
                     new_option = dict()
                     for attr in option:
                         new_option[attr] = option[attr]
                     new_option['revisions'] = dict()
                     new_option['revisions'][version] = True
                     rdata[key].append(new_option)
+                    option_index[option_name] = new_option
             for option in rdata[key]:
-                assert(type(option) is dict)
-                assert('name' in option)
-                option_name = option['name']
-                option_present = False
-                for i in range(len(value)):
-                    assert('name' in value[i])
-                    if value[i]['name'] == option_name:
-                        option_present = True
-                        break
-                if not option_present:
+                if option['name'] not in present_options:
                     assert('revisions' in option)
                     option['revisions'][version] = False
         else:
@@ -118,8 +115,10 @@ def _merge_api_item(api_item0, api_item1, version):
 
     return rdata
 
-def merge_schema(schemas):
-    super_schema = dict()
+def _group_table_histories(schemas):
+    # every path-name table is merged independently, collect its items in version order.
+    table_histories = dict()
+    table_order = list()
     super_version = None
     schemas.sort(key=lambda item: item['version'])
 
@@ -137,14 +136,57 @@ def merge_schema(schemas):
         for api_item in sub_schemas:
             assert (len(api_item) == 3)
             api_path = '%s-%s' % (api_item['path'], api_item['name'])
-            if api_path not in super_schema:
-                super_schema[api_path] = _tag_api_item(api_item, version)
-            else:
-                super_schema[api_path] = _merge_api_item(super_schema[api_path], api_item, version)
+            if api_path not in table_histories:
+                table_histories[api_path] = list()
+                table_order.append(api_path)
+            table_histories[api_path].append((version, api_item))
+    return table_histories, table_order
+
+def _merge_table_history(history):
+    merged_item = None
+    for version, api_item in history:
+        if merged_item is None:
+            merged_item = _tag_api_item(api_item, version)
+        else:
+            merged_item = _merge_api_item(merged_item, api_item, version)
+    return merged_item
+
+_worker_table_histories = None
+
+def _init_merge_worker(table_histories):
+    global _worker_table_histories
+    _worker_table_histories = table_histories
+
+def _merge_table_task(api_path):
+    return api_path, _merge_table_history(_worker_table_histories[api_path])
+
+def merge_schemas(schemas, jobs=1):
+    table_histories, table_order = _group_table_histories(schemas)
+    super_schema = dict()
+    if jobs > 1:
+        # the histories are inherited by the forked workers, only the table keys and merged tables are pickled.
+        pool = multiprocessing.Pool(processes=jobs, initializer=_init_merge_worker, initargs=(table_histories,))
+        try:
+            chunksize = max(1, len(table_order) // (jobs * 4))
+            for api_path, merged_item in pool.imap_unordered(_merge_table_task, table_order, chunksize):
+                super_schema[api_path] = merged_item
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        for api_path in table_order:
+            super_schema[api_path] = _merge_table_history(table_histories[api_path])
     super_top_schema = dict()
     super_top_schema['version'] = 'v6.0.0'
     super_top_schema['action'] = 'schema'
-    super_top_schema['results'] = [super_schema[api_path] for api_path in super_schema]
+    super_top_schema['results'] = [super_schema[api_path] for api_path in table_order]
+    return super_top_schema
+
+def merge_schema(schemas, jobs=1):
+    super_top_schema = merge_schemas(schemas, jobs)
     with open('./fgt_schema.json', 'w') as f:
         f.write(json.dumps(super_top_schema, indent=2))
         f.flush()
@@ -184,9 +226,12 @@ def process_schema(schema1, schema2):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge FortiOS schemas of several versions into fgt_schema.json')
+    parser.add_argument('schemas', nargs='+', help='schema files, one per FortiOS version')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of merging processes, 0 for one per cpu (default: 1)')
+    args = parser.parse_args()
     schemas = list()
-    for i in range(1, len(sys.argv)):
-        schemas.append(load_schema(sys.argv[i]))
-    merge_schema(schemas)
-
-
+    for schema_file in args.schemas:
+        schemas.append(load_schema(schema_file))
+    merge_schema(schemas, args.jobs if args.jobs > 0 else multiprocessing.cpu_count())